@@ -0,0 +1,154 @@
+"""
+Benchmark of the SpeechParser patterns.
+
+Runs every pattern over the real lines in start_sessions.txt and over
+generated adversarial lines, prints throughput per pattern and exits with
+status 1 if any pattern takes longer than the budget on a single line.
+
+    python benchmark_regex.py [--budget-ms 5] [--repeat 3]
+"""
+
+import argparse
+import re
+import sys
+import time
+
+from lxml import html
+
+from parlaparser.parse_speeches_x import SpeechParser
+
+CORPUS_PATH = "start_sessions.txt"
+
+IGNORECASE_PATTERNS = [
+    "REGEX_IS_START_OF_CONTENT",
+    "REGEX_START_WIERD_WB_SESSION",
+    "START_AT_REGEX",
+]
+
+
+def get_patterns(parser_class=SpeechParser):
+    patterns = {}
+    for name in dir(parser_class):
+        value = getattr(parser_class, name)
+        if name.isupper() and isinstance(value, str):
+            flags = re.IGNORECASE if name in IGNORECASE_PATTERNS else 0
+            patterns[name] = re.compile(value, flags)
+    return patterns
+
+
+def load_corpus(path=CORPUS_PATH):
+    """
+    return text and bold text of every line, the two strings the parser
+    runs its patterns on
+    """
+    lines = []
+    with open(path, "r", encoding="utf-8") as f:
+        for raw_line in f:
+            raw_line = raw_line.strip()
+            if not raw_line:
+                continue
+            line_tree = html.fromstring(f"<span>{raw_line}</span>")
+            lines.append(line_tree.text_content())
+            for bold in line_tree.iter("b"):
+                if bold.text:
+                    lines.append(bold.text)
+    return lines
+
+
+def adversarial_lines(max_length=5000):
+    """
+    long lines built from the pieces the patterns repeat, ending in a way that
+    makes the match fail late
+    """
+    pieces = [
+        "PREDSEDNIK ",
+        "JANEZ ",
+        "NOVAK(SDS)",
+        "ČŠŽ.",
+        "janez,",
+        "A.",
+        "(SDS) ",
+        "(a,b) ",
+        "Janez ",
+        "Seja je ",
+        "1. ",
+        "12.12.",
+        "TRAK ",
+        "( ",
+        "   ",
+        "(Seja je bila prekinjena ",
+        "začela ob ",
+    ]
+    endings = ["", ":", "!", ")", " x", "1"]
+    lines = []
+    for piece in pieces:
+        for other in pieces:
+            repeated = (piece + other) * (max_length // len(piece + other))
+            for ending in endings:
+                lines.append(repeated + ending)
+                lines.append("Nadaljevanje " + repeated + ending)
+    return lines
+
+
+def benchmark(pattern, lines, repeat):
+    """
+    return total time of one pass over lines and the slowest line with its
+    time, every line is timed repeat times and the fastest run is used so a
+    single scheduler hiccup is not reported as backtracking
+    """
+    total_time = 0
+    worst_time = 0
+    worst_line = ""
+    for line in lines:
+        line_times = []
+        for _ in range(repeat):
+            line_start = time.perf_counter()
+            pattern.search(line)
+            line_times.append(time.perf_counter() - line_start)
+        line_time = min(line_times)
+        total_time += line_time
+        if line_time > worst_time:
+            worst_time = line_time
+            worst_line = line
+    return total_time, worst_time, worst_line
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--budget-ms", type=float, default=5.0)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    corpus = load_corpus()
+    adversarial = adversarial_lines()
+    corpus_size = sum(len(line) for line in corpus) / 1024 / 1024
+    print(f"{len(corpus)} corpus lines, {len(adversarial)} adversarial lines")
+    print(
+        f"{'pattern':<30} {'lines/s':>12} {'MB/s':>8} {'worst corpus':>14} "
+        f"{'worst adversarial':>18}"
+    )
+
+    failed = []
+    for name, pattern in sorted(get_patterns().items()):
+        corpus_time, corpus_worst, corpus_line = benchmark(pattern, corpus, args.repeat)
+        _, adversarial_worst, adversarial_line = benchmark(
+            pattern, adversarial, args.repeat
+        )
+        print(
+            f"{name:<30} {len(corpus) / corpus_time:>12.0f} "
+            f"{corpus_size / corpus_time:>8.1f} "
+            f"{corpus_worst * 1000:>12.3f}ms {adversarial_worst * 1000:>16.3f}ms"
+        )
+        if corpus_worst * 1000 > args.budget_ms:
+            failed.append((name, corpus_line))
+        if adversarial_worst * 1000 > args.budget_ms:
+            failed.append((name, adversarial_line))
+
+    for name, line in failed:
+        print(f"{name} exceeded {args.budget_ms}ms on line: {line[:80]!r}...")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
 import logging
 from collections import defaultdict
 
-import requests
 from parladata_base_api.storages.storage import DataStorage
 
+from parlaparser.utils.transport import default_transport
 from settings import API_AUTH, API_URL, MAIN_ORG_ID, MANDATE, MANDATE_STARTIME
 
 logger = logging.getLogger("logger")
@@ -33,7 +33,7 @@ def get_data_from_pager_api_gen(url, limit=300):
         url = url + f"?limit={limit}"
     logger.debug(url)
     while url:
-        response = requests.get(url)
+        response = default_transport.get(url)
         if response.status_code != 200:
             logger.warning(response.content)
         data = response.json()
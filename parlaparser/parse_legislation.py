@@ -1,103 +1,119 @@
+import hashlib
+import json
 import locale
 import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from enum import Enum
 
-import requests
 import sentry_sdk
 import xmltodict
 from lxml import html
 
+from parlaparser.utils.document_catalog import get_document_catalog
+from parlaparser.utils.feed_cache import FeedCache
+from parlaparser.utils.links import get_link_sync
 from parlaparser.utils.methods import get_values
-from settings import BASE_URL, MANDATE_GOV_ID
+from parlaparser.utils.ordered_pool import OrderedPool
+from parlaparser.utils.state import StateStore
+from parlaparser.utils.transport import default_transport
+from settings import (
+    BASE_URL,
+    HTTP_MAX_WORKERS,
+    LEGISLATION_PARSER_PROCESSES,
+    MANDATE_GOV_ID,
+)
+
+LEGISLATION_FEEDS = [
+    {
+        "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/PZ.XML",
+        "type": "law",
+        "file_name": "PZ.XML",
+        "xml_key": "PZ",
+    },
+    {
+        "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/PZ9.XML",
+        "type": "law",
+        "file_name": "PZ9.XML",
+        "xml_key": "PZ",
+    },
+    {
+        "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/PA.XML",
+        "type": "act",
+        "file_name": "PA.XML",
+        "xml_key": "PA",
+    },
+    {
+        "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/PA9.XML",
+        "type": "act",
+        "file_name": "PA9.XML",
+        "xml_key": "PA",
+    },
+]
+RESULT_FEEDS = [
+    {
+        "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/SA.XML",
+        "type": "act",
+        "file_name": "SA.XML",
+        "xml_key": "SA",
+    },
+    {
+        "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/SZ.XML",
+        "type": "law",
+        "file_name": "SZ.XML",
+        "xml_key": "SZ",
+    },
+]
+
+# (array_key, obj_key) of legislation and legislation considerations
+LEGISLATION_PASSES = [
+    ("PREDPIS", "KARTICA_PREDPISA"),
+    ("OBRAVNAVA_PREDPISA", "KARTICA_OBRAVNAVE_PREDPISA"),
+]
+RESULT_PASSES = [("PREDPIS", "KARTICA_PREDPISA")]
 
 
 class LegislationParser(object):
-    def __init__(self, storage):
+    def __init__(self, storage, transport=None):
         self.storage = storage
+        self.transport = transport or default_transport
         self.legislation_storage = self.storage.legislation_storage
         locale.setlocale(locale.LC_TIME, "sl_SI.utf-8")
-        self.documents = {}
-
-    def load_documents(self, data, key="PZ"):
-        print("Loading documents")
-
-        documents = data[key].get("DOKUMENT", [])
-
-        for o_doc in documents:
-            doc = o_doc["KARTICA_DOKUMENTA"]
-
-            sub_doc = o_doc["PODDOKUMENTI"]
-            if "PRIPONKA" in doc.keys():
-                urls = get_values(doc["PRIPONKA"], "PRIPONKA_KLIC")
-                self.documents[doc["UNID"]] = {
-                    "title": doc["KARTICA_NAZIV"],
-                    "urls": urls,
-                }
-            elif sub_doc:
-                self.documents[doc["UNID"]] = {
-                    "title": doc["KARTICA_NAZIV"],
-                    "sub-docs": sub_doc["UNID"],
-                }
-            # except:
-            #     print(doc)
-            #     raise Exception("key_error")
-        self.document_keys = self.documents.keys()
-        print(len(self.documents.keys()), " documetns loaded")
+        self.catalog = get_document_catalog(storage)
+        self.feed_cache = FeedCache(transport=self.transport)
+        self.link_sync = get_link_sync(storage)
+        self.fingerprints = StateStore("legislation")
+        self.unchanged_records = 0
+
+    def load_documents(self, data, feed, key="PZ"):
+        if self.catalog.is_loaded("legislation", feed):
+            return
+        documents = get_documents(data, key)
+        self.catalog.add_documents("legislation", documents)
+        self.catalog.mark_loaded("legislation", feed)
+        print(len(documents.keys()), " documetns loaded")
 
-    def parse(self):
+    def parse(self, processes=LEGISLATION_PARSER_PROCESSES):
         print("Start parsing")
         self.mandate = MANDATE_GOV_ID
-        urls = [
-            {
-                "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/PZ.XML",
-                "type": "law",
-                "file_name": "PZ.XML",
-                "xml_key": "PZ",
-            },
-            {
-                "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/PZ9.XML",
-                "type": "law",
-                "file_name": "PZ9.XML",
-                "xml_key": "PZ",
-            },
-            {
-                "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/PA.XML",
-                "type": "act",
-                "file_name": "PA.XML",
-                "xml_key": "PA",
-            },
-            {
-                "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/PA9.XML",
-                "type": "act",
-                "file_name": "PA9.XML",
-                "xml_key": "PA",
-            },
-        ]
-        result_urls = [
-            {
-                "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/SA.XML",
-                "type": "act",
-                "file_name": "SA.XML",
-                "xml_key": "SA",
-            },
-            {
-                "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/SZ.XML",
-                "type": "law",
-                "file_name": "SZ.XML",
-                "xml_key": "SZ",
-            },
-        ]
-        for legislation_file in urls:
+        if processes > 1:
+            self.parse_parallel(processes)
+            return
+
+        for legislation_file in LEGISLATION_FEEDS:
             print("parse file: ", legislation_file["file_name"])
-            response = requests.get(legislation_file["url"])
-            with open(f'/tmp/{legislation_file["file_name"]}', "wb") as f:
-                f.write(response.content)
-            with open(f'/tmp/{legislation_file["file_name"]}', "rb") as data_file:
+            feed = self.feed_cache.fetch(
+                legislation_file["url"], legislation_file["file_name"]
+            )
+            if not feed.changed:
+                print(f"Skip unchanged feed {legislation_file['file_name']}")
+                continue
+
+            with open(feed.path, "rb") as data_file:
                 data = xmltodict.parse(data_file, dict_constructor=dict)
 
             # load documents from XML
-            self.load_documents(data, legislation_file["xml_key"])
+            self.load_documents(data, feed, legislation_file["xml_key"])
             self.parse_xml_data(
                 data, legislation_file, array_key="PREDPIS", obj_key="KARTICA_PREDPISA"
             )
@@ -107,17 +123,97 @@ class LegislationParser(object):
                 array_key="OBRAVNAVA_PREDPISA",
                 obj_key="KARTICA_OBRAVNAVE_PREDPISA",
             )
+            self.mark_processed(feed)
 
-        for enacted_law in result_urls:
+        for enacted_law in RESULT_FEEDS:
             print("parse file: ", enacted_law["file_name"])
-            response = requests.get(enacted_law["url"])
-            with open(f'/tmp/{enacted_law["file_name"]}', "wb") as f:
-                f.write(response.content)
-            with open(f'/tmp/{enacted_law["file_name"]}', "rb") as data_file:
+            feed = self.feed_cache.fetch(enacted_law["url"], enacted_law["file_name"])
+            if not feed.changed:
+                print(f"Skip unchanged feed {enacted_law['file_name']}")
+                continue
+
+            with open(feed.path, "rb") as data_file:
                 data = xmltodict.parse(data_file, dict_constructor=dict)
             self.parse_xml_data(
                 data, enacted_law, array_key="PREDPIS", obj_key="KARTICA_PREDPISA"
             )
+            self.mark_processed(feed)
+        print(f"Skipped {self.unchanged_records} unchanged legislation records")
+
+    def parse_parallel(self, processes):
+        """
+        Download all feeds in threads and decode the changed ones in worker
+        processes, then save legislation grouped by EPA. Records of one EPA
+        are saved in the same order as in the serial parse.
+        """
+        feeds = LEGISLATION_FEEDS + RESULT_FEEDS
+        with ThreadPoolExecutor(
+            max_workers=min(HTTP_MAX_WORKERS, len(feeds))
+        ) as executor:
+            fetched = list(
+                executor.map(
+                    lambda legislation_file: self.feed_cache.fetch(
+                        legislation_file["url"], legislation_file["file_name"]
+                    ),
+                    feeds,
+                )
+            )
+
+        changed = []
+        for legislation_file, feed in zip(feeds, fetched):
+            if feed.changed:
+                changed.append((legislation_file, feed))
+            else:
+                print(f"Skip unchanged feed {legislation_file['file_name']}")
+        if not changed:
+            return
+
+        decoded = []
+        pool = OrderedPool(min(processes, len(changed)))
+        try:
+            for legislation_file, feed in changed:
+                print("parse file: ", legislation_file["file_name"])
+                is_result = legislation_file in RESULT_FEEDS
+                pool.submit(
+                    decode_legislation_feed,
+                    (
+                        legislation_file,
+                        feed.path,
+                        self.mandate,
+                        RESULT_PASSES if is_result else LEGISLATION_PASSES,
+                        not (is_result or self.catalog.is_loaded("legislation", feed)),
+                    ),
+                    decoded.append,
+                )
+            pool.drain()
+        finally:
+            pool.terminate()
+
+        records_by_epa = {}
+        for (legislation_file, feed), (documents, records) in zip(changed, decoded):
+            if documents:
+                self.catalog.add_documents("legislation", documents)
+                self.catalog.mark_loaded("legislation", feed)
+            for epa, array_key, obj_key, wraped_legislation in records:
+                records_by_epa.setdefault(epa, []).append(
+                    (wraped_legislation, legislation_file, array_key, obj_key)
+                )
+
+        print(f"Saving legislation of {len(records_by_epa)} EPAs")
+        for epa_records in records_by_epa.values():
+            for record in epa_records:
+                self.save_legislation(*record)
+
+        for legislation_file, feed in changed:
+            self.mark_processed(feed)
+        print(f"Skipped {self.unchanged_records} unchanged legislation records")
+
+    def mark_processed(self, feed):
+        # links and fingerprints of saved records first, a crash after it
+        # only costs parsing the feed again
+        self.link_sync.flush()
+        self.fingerprints.save()
+        self.feed_cache.mark_processed(feed)
 
     def get_procedured(data, legislation_file, array_key, obj_key):
         """
@@ -147,117 +243,157 @@ class LegislationParser(object):
             print(e)
             return
         for wraped_legislation in legislation_list:
-            legislation = wraped_legislation[obj_key]
+            self.save_legislation(
+                wraped_legislation, legislation_file, array_key, obj_key
+            )
 
-            epa = self.remove_leading_zeros(legislation["KARTICA_EPA"])
-            if self.mandate not in epa:
-                continue
+    def save_legislation(
+        self, wraped_legislation, legislation_file, array_key, obj_key
+    ):
+        legislation = wraped_legislation[obj_key]
 
-            title = legislation["KARTICA_NAZIV"]
-            unid = legislation["UNID"]
-            date = legislation["KARTICA_DATUM"]
-            champion = legislation["KARTICA_PREDLAGATELJ"]
-            champion_wb = legislation["KARTICA_DELOVNA_TELESA"]
-            legislation_procedure_type = legislation["KARTICA_POSTOPEK"]
-            legislation_procedure_phase = legislation["KARTICA_FAZA_POSTOPKA"]
-            legislation_session = legislation.get("KARTICA_SEJA", None)
-            if date:
-                date_iso = datetime.strptime(date, "%Y-%m-%d").isoformat()
-            else:
-                date_iso = None
-
-            legislation_documents = wraped_legislation.get("PODDOKUMENTI", [])
-            document_unids = get_values(legislation_documents)
+        epa = self.remove_leading_zeros(legislation["KARTICA_EPA"])
+        if self.mandate not in epa:
+            return
 
-            if legislation_session:
-                legislation_session = legislation_session.strip("0").lower() + " seja"
+        # PZ and PZ9 share the xml key, cards are keyed by the feed file
+        fingerprint_key = "/".join(
+            [legislation_file["file_name"], array_key, epa, legislation["UNID"]]
+        )
+        # considerations saved before their session was parsed are saved
+        # again when the session appears
+        session_id = None
+        if array_key != "PREDPIS":
+            session_id = self.get_consideration_session_id(legislation)
+        fingerprint = get_legislation_fingerprint(
+            wraped_legislation, legislation_file, session_id
+        )
+        if self.fingerprints.get(fingerprint_key) == fingerprint:
+            self.unchanged_records += 1
+            return
 
-            if champion_wb:
-                champion_wb = self.storage.organization_storage.get_or_add_object(
-                    {"name": champion_wb}
-                ).id
-            else:
-                champion_wb = None
-
-            connected_legislation = wraped_legislation.get("POVEZANI_PREDPISI", [])
-            connected_legislation_unids = get_values(connected_legislation)
-
-            if array_key == "PREDPIS":  # legislation
-                law_data = {
-                    "text": title,
-                    "epa": epa,
-                    "uid": unid,
-                    "proposer_text": champion,
-                    "procedure_type": legislation_procedure_type,
-                    "mdt_fk": champion_wb,
-                    "timestamp": date_iso,
-                    "classification": self.legislation_storage.get_legislation_classifications_by_name(
-                        legislation_file["type"]
-                    ),
-                    "mandate": self.storage.mandate_id,
-                }
-                self.add_or_update_legislation(law_data, document_unids)
-            else:  # legislation consideration
-                procedure_org = (
-                    champion_wb
-                    if "MDT" in legislation_procedure_phase
-                    else self.storage.main_org_id
-                )
-                data = {
-                    "epa": epa,
-                    "uid": unid,
-                    "organization": procedure_org,
-                    "timestamp": date_iso,
-                    "consideration_phase": legislation_procedure_phase,
-                    "session": None,
-                }
-                if legislation_session and champion_wb:
-                    session = self.storage.session_storage.get_object_or_none(
-                        {
-                            "name": legislation_session,
-                            "organizations": [procedure_org],
-                        }
-                    )
-                    if session:
-                        data.update(session=session.id)
-                legislation_consideration = (
-                    self.prepare_data_and_set_legislation_consideration(data)
+        title = legislation["KARTICA_NAZIV"]
+        unid = legislation["UNID"]
+        date = legislation["KARTICA_DATUM"]
+        champion = legislation["KARTICA_PREDLAGATELJ"]
+        champion_wb = legislation["KARTICA_DELOVNA_TELESA"]
+        legislation_procedure_type = legislation["KARTICA_POSTOPEK"]
+        legislation_procedure_phase = legislation["KARTICA_FAZA_POSTOPKA"]
+        if date:
+            date_iso = datetime.strptime(date, "%Y-%m-%d").isoformat()
+        else:
+            date_iso = None
+
+        legislation_documents = wraped_legislation.get("PODDOKUMENTI", [])
+        document_unids = get_values(legislation_documents)
+
+        if champion_wb:
+            champion_wb = self.storage.organization_storage.get_or_add_object(
+                {"name": champion_wb}
+            ).id
+        else:
+            champion_wb = None
+
+        connected_legislation = wraped_legislation.get("POVEZANI_PREDPISI", [])
+        connected_legislation_unids = get_values(connected_legislation)
+
+        if array_key == "PREDPIS":  # legislation
+            law_data = {
+                "text": title,
+                "epa": epa,
+                "uid": unid,
+                "proposer_text": champion,
+                "procedure_type": legislation_procedure_type,
+                "mdt_fk": champion_wb,
+                "timestamp": date_iso,
+                "classification": self.legislation_storage.get_legislation_classifications_by_name(
+                    legislation_file["type"]
+                ),
+                "mandate": self.storage.mandate_id,
+            }
+            self.add_or_update_legislation(law_data, document_unids)
+        else:  # legislation consideration
+            procedure_org = (
+                champion_wb
+                if "MDT" in legislation_procedure_phase
+                else self.storage.main_org_id
+            )
+            data = {
+                "epa": epa,
+                "uid": unid,
+                "organization": procedure_org,
+                "timestamp": date_iso,
+                "consideration_phase": legislation_procedure_phase,
+                "session": session_id,
+            }
+            legislation_consideration = (
+                self.prepare_data_and_set_legislation_consideration(data)
+            )
+            if legislation_consideration.is_new:
+                """
+                if is new legislation consideration set documents and legislation status
+                """
+                self.add_docs(
+                    document_unids,
+                    {"legislation_consideration": legislation_consideration.id},
                 )
-                if legislation_consideration.is_new:
-                    """
-                    if is new legislation consideration set documents and legislation status
-                    """
-                    self.add_docs(
-                        document_unids,
-                        {"legislation_consideration": legislation_consideration.id},
-                    )
 
-                    if epa == "1470-IX":
-                        print([self.get_doc_title(c_unid) for c_unid in document_unids])
+                if epa == "1470-IX":
+                    print([self.get_doc_title(c_unid) for c_unid in document_unids])
 
-                    if legislation_procedure_phase.strip() == "konec postopka":
-                        self.legislation_storage.set_law_as_rejected(epa)
-                    elif legislation_procedure_phase.strip() == "sprejet predlog":
-                        # check if procedure is call for referendum
-                        is_referendum = any(
+                if legislation_procedure_phase.strip() == "konec postopka":
+                    self.legislation_storage.set_law_as_rejected(epa)
+                elif legislation_procedure_phase.strip() == "sprejet predlog":
+                    # check if procedure is call for referendum
+                    is_referendum = any(
+                        [
                             [
-                                [
-                                    self.get_doc_title(c_unid)
-                                    == "Pobuda za zakonodajni referendum"
-                                    for c_unid in document_unids
-                                ]
+                                self.get_doc_title(c_unid)
+                                == "Pobuda za zakonodajni referendum"
+                                for c_unid in document_unids
                             ]
-                        )
-
-                        if is_referendum:
-                            self.legislation_storage.set_law_as_in_procedure(epa)
-                        else:
-                            self.legislation_storage.set_law_as_enacted(epa)
-                    elif (
-                        legislation_procedure_phase.strip()
-                        == "zahteva za ponovno odločanje"
-                    ):
+                        ]
+                    )
+
+                    if is_referendum:
                         self.legislation_storage.set_law_as_in_procedure(epa)
+                    else:
+                        self.legislation_storage.set_law_as_enacted(epa)
+                elif (
+                    legislation_procedure_phase.strip()
+                    == "zahteva za ponovno odločanje"
+                ):
+                    self.legislation_storage.set_law_as_in_procedure(epa)
+
+        self.fingerprints.set(fingerprint_key, fingerprint, save=False)
+
+    def get_consideration_session_id(self, legislation):
+        """
+        return id of the session of the legislation consideration card, None
+        if the card has no session or the session isn't parsed yet
+        """
+        legislation_session = legislation.get("KARTICA_SEJA", None)
+        champion_wb = legislation["KARTICA_DELOVNA_TELESA"]
+        if not (legislation_session and champion_wb):
+            return None
+        if "MDT" in legislation["KARTICA_FAZA_POSTOPKA"]:
+            # runs before the fingerprint check, unknown organizations are
+            # added only for changed cards and have no sessions yet
+            organization = self.storage.organization_storage.get_or_add_object(
+                {"name": champion_wb}, add=False
+            )
+            if not organization:
+                return None
+            procedure_org = organization.id
+        else:
+            procedure_org = self.storage.main_org_id
+        session = self.storage.session_storage.get_object_or_none(
+            {
+                "name": legislation_session.strip("0").lower() + " seja",
+                "organizations": [procedure_org],
+            }
+        )
+        return session.id if session else None
 
     def parser_results_xml(self, data, legislation_file, array_key, obj_key):
         try:
@@ -319,34 +455,104 @@ class LegislationParser(object):
         if not document_unid:
             return ""
 
-        if document_unid in self.document_keys:
-            return self.documents[document_unid]["title"]
+        document = self.catalog.get_document("legislation", document_unid)
+        if document:
+            return document["title"]
         return None
 
     def add_docs(self, document_unids, document_parent_object):
         if not document_unids:
             return
         for doc_unid in document_unids:
-            if doc_unid in self.document_keys:
-                document = self.documents[doc_unid]
-                doc_title = document["title"]
-                if "urls" in document.keys():
-                    for doc_url in document["urls"]:
-                        link_data = {
-                            "url": doc_url,
-                            "name": doc_title,
-                        }
-                        link_data.update(document_parent_object)
-                        self.storage.parladata_api.links.set(link_data)
-                elif "sub-docs" in document.keys():
-                    self.add_docs(document["sub-docs"], document_parent_object)
+            # attachments of sub-documents are flattened in the catalog
+            for doc_url, doc_title in self.catalog.get_attachments(
+                "legislation", doc_unid
+            ):
+                link_data = {
+                    "url": doc_url,
+                    "name": doc_title,
+                }
+                link_data.update(document_parent_object)
+                self.link_sync.add(link_data)
 
     def remove_leading_zeros(self, word, separeted_by=[",", "-", "/"]):
-        for separator in separeted_by:
-            word = separator.join(
-                map(lambda x: x.lstrip("0"), word.split(separator))
-            ).strip()
-        return word
+        return remove_leading_zeros(word, separeted_by)
+
+
+def get_legislation_fingerprint(wraped_legislation, legislation_file, session_id=None):
+    """
+    hash of the legislation card, its documents, the feed type and the id of
+    the session the card was saved with
+    """
+    data = json.dumps(
+        [legislation_file["type"], session_id, wraped_legislation], sort_keys=True
+    ).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def remove_leading_zeros(word, separeted_by=[",", "-", "/"]):
+    for separator in separeted_by:
+        word = separator.join(
+            map(lambda x: x.lstrip("0"), word.split(separator))
+        ).strip()
+    return word
+
+
+def get_documents(data, key="PZ"):
+    print("Loading documents")
+    output = {}
+
+    documents = data[key].get("DOKUMENT", [])
+
+    for o_doc in documents:
+        doc = o_doc["KARTICA_DOKUMENTA"]
+
+        sub_doc = o_doc["PODDOKUMENTI"]
+        if "PRIPONKA" in doc.keys():
+            urls = get_values(doc["PRIPONKA"], "PRIPONKA_KLIC")
+            output[doc["UNID"]] = {
+                "title": doc["KARTICA_NAZIV"],
+                "urls": urls,
+            }
+        elif sub_doc:
+            output[doc["UNID"]] = {
+                "title": doc["KARTICA_NAZIV"],
+                "sub-docs": get_values(sub_doc),
+            }
+        # except:
+        #     print(doc)
+        #     raise Exception("key_error")
+    return output
+
+
+def decode_legislation_feed(args):
+    """
+    Parse one legislation feed, runs in a worker process. Returns documents
+    of the feed and (epa, array_key, obj_key, record) of legislation of the
+    mandate in the order of the serial parse.
+    """
+    legislation_file, path, mandate, passes, with_documents = args
+    with open(path, "rb") as data_file:
+        data = xmltodict.parse(data_file, dict_constructor=dict)
+
+    documents = {}
+    if with_documents:
+        documents = get_documents(data, legislation_file["xml_key"])
+
+    records = []
+    for array_key, obj_key in passes:
+        try:
+            legislation_list = data[legislation_file["xml_key"]][array_key]
+        except Exception as e:
+            print(legislation_file)
+            print(data.keys())
+            print(e)
+            continue
+        for wraped_legislation in legislation_list:
+            epa = remove_leading_zeros(wraped_legislation[obj_key]["KARTICA_EPA"])
+            if mandate in epa:
+                records.append((epa, array_key, obj_key, wraped_legislation))
+    return documents, records
 
 
 # OBRAVNAVA_PREDPISA -> KARTICA_FAZA_POSTOPKA
@@ -2,111 +2,209 @@ import locale
 import re
 from datetime import datetime
 
-import requests
-import xmltodict
+from parladata_base_api.storages.question_storage import Question
 
+from parlaparser.utils.document_catalog import get_document_catalog
+from parlaparser.utils.feed_cache import FeedCache
+from parlaparser.utils.links import get_link_sync
 from parlaparser.utils.methods import get_values
+from parlaparser.utils.people import get_people_resolver
+from parlaparser.utils.transport import default_transport
+from parlaparser.utils.xml_stream import iter_records
+from settings import QUESTION_BATCH_SIZE
 
 
 class QuestionParser(object):
-    def __init__(self, storage):
+    def __init__(self, storage, transport=None):
         self.storage = storage
+        self.transport = transport or default_transport
         self.question_storage = storage.question_storage
         locale.setlocale(locale.LC_TIME, "sl_SI.utf-8")
-        self.documents = {}
-
-    def load_documents(self, data):
-        print("Loading documents")
-
-        for doc in data["VPP"]["DOKUMENT"]:
-            try:
-                if "PRIPONKA" in doc.keys():
-                    urls = get_values(doc["PRIPONKA"], "PRIPONKA_KLIC")
-                    self.documents[doc["KARTICA_DOKUMENTA"]["UNID"]] = {
-                        "title": doc["KARTICA_DOKUMENTA"]["KARTICA_NASLOV"],
-                        "urls": urls,
-                    }
-            except:
-                print(doc)
-                raise Exception("key_error")
-        self.document_keys = self.documents.keys()
+        self.catalog = get_document_catalog(storage)
+        self.feed_cache = FeedCache(transport=self.transport)
+        self.link_sync = get_link_sync(storage)
+
+    def load_document(self, doc, documents):
+        try:
+            if "PRIPONKA" in doc.keys():
+                urls = get_values(doc["PRIPONKA"], "PRIPONKA_KLIC")
+                documents[doc["KARTICA_DOKUMENTA"]["UNID"]] = {
+                    "title": doc["KARTICA_DOKUMENTA"]["KARTICA_NASLOV"],
+                    "urls": urls,
+                }
+        except:
+            print(doc)
+            raise Exception("key_error")
+
+    def load_parsed_keys(self):
+        """
+        keys of all questions of the mandate, loaded with one paginated request
+        """
+        self.question_storage.load_data()
+        return set(self.question_storage.questions.keys())
 
     def parse(self):
         url = f"https://fotogalerija.dz-rs.si/datoteke/opendata/VPP.XML"
-        response = requests.get(url)
-        with open(f"/tmp/VPP.XML", "wb") as f:
-            f.write(response.content)
-        with open("/tmp/VPP.XML", "rb") as data_file:
-            data = xmltodict.parse(data_file, dict_constructor=dict)
-
-        # load documents from XML
-        self.load_documents(data)
-
-        for question in data["VPP"]["VPRASANJE"]:
-
-            question_card = question["KARTICA_VPRASANJA"]
-            question_documents = question.get("PODDOKUMENTI", [])
-            document_unids = get_values(question_documents)
-
-            authors = question_card["KARTICA_VLAGATELJ"]
-            date = question_card["KARTICA_DATUM"]
-            title = question_card["KARTICA_NASLOV"]
-            recipient_text = question_card["KARTICA_NASLOVLJENEC"]
-            question_type_text = question_card["KARTICA_VRSTA"]
-            question_unid = question_card["UNID"]
-            timestamp = datetime.strptime(date, "%Y-%m-%d")
-
-            if question_type_text == "PP":
-                question_type = "initiative"
-            elif question_type_text == "PPV":
-                question_type = "question"
-            elif question_type_text == "UPV":
-                question_type = "question"
-            else:
-                raise Exception(f"Unkonwn question type: {question_type_text}")
-
-            question_data = {
-                "title": title,
-                "recipient_text": recipient_text,
-                "type_of_question": question_type,
-                "timestamp": timestamp.isoformat(),
-                "gov_id": question_unid,
-                "mandate": self.storage.mandate_id,
-            }
-            if self.question_storage.check_if_question_is_parsed(question_data):
-                print("question is alredy parsed")
+        feed = self.feed_cache.fetch(url, "VPP.XML")
+        if not feed.changed:
+            print("Skip unchanged feed VPP.XML")
+            return
+
+        parsed_keys = self.load_parsed_keys()
+
+        # stream questions and documents from XML, documents are added to the
+        # catalog if this content of the feed wasn't loaded yet
+        load_documents = not self.catalog.is_loaded("questions", feed)
+        tags = ("VPRASANJE", "DOKUMENT") if load_documents else ("VPRASANJE",)
+        documents = {}
+        new_questions = []
+        for tag, record in iter_records(feed.path, tags):
+            if tag == "DOKUMENT":
+                self.load_document(record, documents)
                 continue
 
-            print(f"{authors}: {title}")
-
-            if isinstance(authors, list):
-                pass
-            else:
-                authors = [authors]
-
-            people_ids = []
-            for author in authors:
-                person = self.storage.people_storage.get_or_add_object(
-                    {
-                        "name": author,
-                    }
-                )
-                people_ids.append(person.id)
-
-            question_data.update({"person_authors": people_ids})
-
-            question = self.question_storage.get_or_add_object(question_data)
-
-            question_id = question.id
-
+            question_data, authors, document_unids = self.get_question_data(record)
+            key = Question.get_key_from_dict(question_data)
+            if key in parsed_keys:
+                continue
+            parsed_keys.add(key)
+            new_questions.append((question_data, authors, document_unids))
+
+        if load_documents:
+            self.catalog.add_documents("questions", documents)
+            self.catalog.mark_loaded("questions", feed)
+
+        print(f"Feed has {len(new_questions)} new questions")
+        if new_questions:
+            self.add_questions(new_questions)
+
+        self.link_sync.flush()
+        self.feed_cache.mark_processed(feed)
+
+    def get_question_data(self, question):
+        """
+        return question data, authors and document unids of a VPRASANJE record
+        """
+        question_card = question["KARTICA_VPRASANJA"]
+        question_documents = question.get("PODDOKUMENTI", [])
+        document_unids = get_values(question_documents)
+
+        authors = question_card["KARTICA_VLAGATELJ"]
+        date = question_card["KARTICA_DATUM"]
+        title = question_card["KARTICA_NASLOV"]
+        recipient_text = question_card["KARTICA_NASLOVLJENEC"]
+        question_type_text = question_card["KARTICA_VRSTA"]
+        question_unid = question_card["UNID"]
+        timestamp = datetime.strptime(date, "%Y-%m-%d")
+
+        if question_type_text == "PP":
+            question_type = "initiative"
+        elif question_type_text == "PPV":
+            question_type = "question"
+        elif question_type_text == "UPV":
+            question_type = "question"
+        else:
+            raise Exception(f"Unkonwn question type: {question_type_text}")
+
+        question_data = {
+            "title": title,
+            "recipient_text": recipient_text,
+            "type_of_question": question_type,
+            "timestamp": timestamp.isoformat(),
+            "gov_id": question_unid,
+            "mandate": self.storage.mandate_id,
+        }
+
+        if isinstance(authors, list):
+            pass
+        else:
+            authors = [authors]
+
+        return question_data, authors, document_unids
+
+    def add_questions(self, new_questions):
+        """
+        resolve authors of all new questions at once, create the questions and
+        add links to their documents
+        """
+        people = get_people_resolver(self.storage).resolve_many(
+            [author for _, authors, _ in new_questions for author in authors]
+        )
+        questions_data = []
+        for question_data, authors, _ in new_questions:
+            print(f"{authors}: {question_data['title']}")
+            question_data.update(
+                {"person_authors": [people[author].id for author in authors]}
+            )
+            questions_data.append(question_data)
+
+        questions = self.create_questions(questions_data)
+
+        for question, (_, _, document_unids) in zip(questions, new_questions):
+            documents = self.catalog.get_documents("questions", document_unids)
             for doc_unid in document_unids:
-                if doc_unid in self.document_keys:
-                    document = self.documents[doc_unid]
+                if doc_unid in documents:
+                    document = documents[doc_unid]
                     doc_title = document["title"]
                     for doc_url in document["urls"]:
                         link_data = {
-                            "question": question_id,
+                            "question": question.id,
                             "url": doc_url,
                             "name": doc_title,
                         }
-                        self.storage.parladata_api.links.set(link_data)
+                        self.link_sync.add(link_data)
+
+    def create_questions(self, questions_data, batch_size=QUESTION_BATCH_SIZE):
+        """
+        create questions in bulk requests of at most batch_size questions,
+        fall back to one request per question if the api doesn't accept a
+        list or a request fails
+        """
+        print(f"Add {len(questions_data)} new questions")
+        questions = []
+        bulk_create = True
+        for start in range(0, len(questions_data), batch_size):
+            batch = questions_data[start : start + batch_size]
+            created = self.create_batch(batch) if bulk_create else None
+            if created is None:
+                if bulk_create:
+                    self.load_created_questions()
+                    bulk_create = False
+                created = [
+                    self.question_storage.get_or_add_object(question_data)
+                    for question_data in batch
+                ]
+            questions.extend(created)
+        return questions
+
+    def create_batch(self, batch):
+        """
+        return created questions, None if the bulk request failed
+        """
+        try:
+            response_data = self.storage.parladata_api.questions.set(batch)
+        except Exception as e:
+            # the api wraps request errors in tenacity's RetryError
+            print(f"Bulk create of questions failed, add them one by one: {e}")
+            return None
+        if not (isinstance(response_data, list) and len(response_data) == len(batch)):
+            return None
+        return [
+            self.question_storage.store_object(question, is_new=True)
+            for question in response_data
+        ]
+
+    def load_created_questions(self):
+        """
+        store questions which a failed bulk request created anyway, so they
+        aren't created again one by one
+        """
+        questions = self.storage.parladata_api.questions.get_all(
+            mandate=self.storage.mandate_id
+        )
+        for question in questions:
+            if (
+                Question.get_key_from_dict(question)
+                not in self.question_storage.questions
+            ):
+                self.question_storage.store_object(question, is_new=True)
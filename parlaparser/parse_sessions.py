@@ -4,12 +4,18 @@ from datetime import datetime
 from enum import Enum
 
 import sentry_sdk
-import xmltodict
-from lxml import html
+from lxml import etree, html
 
 from parlaparser.parse_speeches_x import SpeechParser
 from parlaparser.parse_votes import VotesParser
+from parlaparser.utils.document_catalog import get_document_catalog
+from parlaparser.utils.feed_cache import FeedCache
+from parlaparser.utils.links import get_link_sync
 from parlaparser.utils.methods import get_values, get_with_retry
+from parlaparser.utils.ordered_pool import OrderedPool
+from parlaparser.utils.transport import default_transport
+from parlaparser.utils.xml_stream import iter_records
+from settings import SPEECH_PARSER_PROCESSES
 
 
 class ParserState(Enum):
@@ -31,31 +37,52 @@ SESSION_TYPES = {
 
 
 class SessionParser(object):
-    def __init__(self, storage):
+    def __init__(self, storage, transport=None):
         self.storage = storage
+        self.transport = transport or default_transport
         locale.setlocale(locale.LC_TIME, "sl_SI.utf-8")
-        self.documents = {}
-        self.magnetograms = {}
-
-    def load_documents(self, data, root_key):
-        print("Loading documents")
-
-        for doc in data[root_key]["DOKUMENT"]:
-            try:
-                if "PRIPONKA" in doc.keys():
-                    urls = get_values(doc["PRIPONKA"], "PRIPONKA_KLIC")
-                    self.documents[doc["KARTICA_DOKUMENTA"]["UNID"]] = {
-                        "title": doc["KARTICA_DOKUMENTA"]["KARTICA_NASLOV"],
-                        "urls": urls,
-                    }
-                elif "KARTICA_URL_MAGNETOGRAM" in doc["KARTICA_DOKUMENTA"]:
-                    self.magnetograms[doc["KARTICA_DOKUMENTA"]["UNID"]] = doc[
-                        "KARTICA_DOKUMENTA"
-                    ]["KARTICA_URL_MAGNETOGRAM"]
-            except:
-                print(doc)
-                raise Exception("key_error")
-        self.document_keys = self.documents.keys()
+        self.catalog = get_document_catalog(storage)
+        self.feed_cache = FeedCache(transport=self.transport)
+        self.link_sync = get_link_sync(storage)
+        self.pool = None
+
+    def load_sessions(self, feed):
+        """
+        stream SEJA records from the feed and return them, DOKUMENT records
+        are added to the document catalog if this content of the feed wasn't
+        loaded yet
+        """
+        if self.catalog.is_loaded("sessions", feed):
+            print("Loading sessions")
+            return [record for tag, record in iter_records(feed.path, ("SEJA",))]
+
+        print("Loading sessions and documents")
+        sessions = []
+        documents = {}
+        for tag, record in iter_records(feed.path, ("SEJA", "DOKUMENT")):
+            if tag == "SEJA":
+                sessions.append(record)
+            else:
+                self.load_document(record, documents)
+        self.catalog.add_documents("sessions", documents)
+        self.catalog.mark_loaded("sessions", feed)
+        return sessions
+
+    def load_document(self, doc, documents):
+        try:
+            if "PRIPONKA" in doc.keys():
+                urls = get_values(doc["PRIPONKA"], "PRIPONKA_KLIC")
+                documents[doc["KARTICA_DOKUMENTA"]["UNID"]] = {
+                    "title": doc["KARTICA_DOKUMENTA"]["KARTICA_NASLOV"],
+                    "urls": urls,
+                }
+            elif "KARTICA_URL_MAGNETOGRAM" in doc["KARTICA_DOKUMENTA"]:
+                documents[doc["KARTICA_DOKUMENTA"]["UNID"]] = {
+                    "magnetogram": doc["KARTICA_DOKUMENTA"]["KARTICA_URL_MAGNETOGRAM"]
+                }
+        except:
+            print(doc)
+            raise Exception("key_error")
 
     def parse(
         self,
@@ -64,8 +91,36 @@ class SessionParser(object):
         session_uid=None,
         parse_speeches=False,
         parse_votes=False,
+        processes=SPEECH_PARSER_PROCESSES,
+    ):
+        """
+        With more than one process transcripts are parsed in a process pool
+        while the next sessions are loaded, speeches are still saved session by
+        session in feed order.
+        """
+        if parse_speeches and processes > 1:
+            self.pool = OrderedPool(processes)
+        try:
+            self.parse_sessions(
+                session_number,
+                session_type,
+                session_uid,
+                parse_speeches,
+                parse_votes,
+            )
+        finally:
+            if self.pool:
+                self.pool.terminate()
+                self.pool = None
+
+    def parse_sessions(
+        self,
+        session_number=None,
+        session_type=None,
+        session_uid=None,
+        parse_speeches=False,
+        parse_votes=False,
     ):
-
         session_url_groups = [
             {
                 "url": "https://fotogalerija.dz-rs.si/datoteke/opendata/SDZ.XML",
@@ -83,31 +138,31 @@ class SessionParser(object):
             },
         ]
 
+        # transcripts of sessions in review change on dz-rs.si without
+        # changing the feed, so those have to be checked on every run
+        if not self.storage.session_storage.sessions:
+            self.storage.session_storage.load_data()
+        has_sessions_in_review = bool(self.storage.session_storage.sessions_in_review)
+        is_targeted = bool(session_number or session_type or session_uid)
+
         for url_group in session_url_groups:
-            response = get_with_retry(url_group["url"])
-            if response.status_code != 200:
-                sentry_sdk.capture_message(
-                    f"Failed to download session data from {url_group['url']}"
-                )
+            feed = self.feed_cache.fetch(url_group["url"], url_group["file_name"])
+            if not (feed.changed or has_sessions_in_review or is_targeted):
+                print(f"Skip unchanged feed {url_group['file_name']}")
                 continue
 
-            with open(f'/tmp/{url_group["file_name"]}', "wb") as f:
-                f.write(response.content)
-            with open(f'/tmp/{url_group["file_name"]}', "rb") as data_file:
-                try:
-                    data = xmltodict.parse(data_file, dict_constructor=dict)
-                except Exception as e:
-                    sentry_sdk.capture_exception(e)
-                    continue
-
-            # load documents from XML
-            self.load_documents(data, url_group["root_key"])
+            # load sessions and documents from XML
+            try:
+                sessions = self.load_sessions(feed)
+            except etree.XMLSyntaxError as e:
+                sentry_sdk.capture_exception(e)
+                continue
 
-            # load type of subjects
-            num_of_session = len(data[url_group["root_key"]]["SEJA"])
-            for index, session in enumerate(
-                list(reversed(data[url_group["root_key"]]["SEJA"]))
-            ):
+            # parsers of transcripts which are saved when the pool is drained
+            speech_parsers = []
+            is_complete = True
+            num_of_session = len(sessions)
+            for index, session in enumerate(reversed(sessions)):
                 print()
                 print("New session")
                 # print(session['KARTICA_SEJE']['KARTICA_OZNAKA'])
@@ -141,11 +196,12 @@ class SessionParser(object):
 
                 session_documents = session.get("PODDOKUMENTI", [])
                 document_unids = get_values(session_documents)
+                documents = self.catalog.get_documents("sessions", document_unids)
 
                 sklic_seje_unid = None
                 for doc_unid in document_unids:
-                    if doc_unid in self.document_keys:
-                        document = self.documents[doc_unid]
+                    if doc_unid in documents:
+                        document = documents[doc_unid]
                         if document["title"] and (
                             document["title"] == "Sklic seje"
                             or document["title"]
@@ -161,7 +217,9 @@ class SessionParser(object):
 
                 sklic_url = session_url
                 print("---> sklic_url:", sklic_url)
-                sklic_content = get_with_retry(sklic_url).content
+                sklic_content = get_with_retry(
+                    sklic_url, transport=self.transport
+                ).content
                 sklic_htree = html.fromstring(sklic_content)
                 print(session["KARTICA_SEJE"])
 
@@ -240,8 +298,8 @@ class SessionParser(object):
 
                 if current_session.is_new and document_unids:
                     for doc_unid in document_unids:
-                        if doc_unid in self.document_keys:
-                            document = self.documents[doc_unid]
+                        if doc_unid in documents:
+                            document = documents[doc_unid]
                             doc_title = document["title"]
                             for doc_url in document["urls"]:
                                 link_data = {
@@ -249,7 +307,7 @@ class SessionParser(object):
                                     "url": doc_url,
                                     "name": doc_title,
                                 }
-                                self.storage.parladata_api.links.set(link_data)
+                                self.link_sync.add(link_data)
 
                 # parsing SPEECHES
                 print("parse speeches?: ", parse_speeches)
@@ -257,18 +315,41 @@ class SessionParser(object):
                     start_order = 0
                     speech_urls = []
                     for orginal_speech_unid in speech_unids:
-                        try:
-                            speech_urls.append(self.magnetograms[orginal_speech_unid])
-                        except:
-                            pass
+                        magnetogram = self.catalog.get_magnetogram(
+                            "sessions", orginal_speech_unid
+                        )
+                        if magnetogram:
+                            speech_urls.append(magnetogram)
 
                     print("speech_unids")
                     print(speech_unids)
 
                     speech_parser = SpeechParser(
-                        self.storage, speech_urls, current_session, start_time
+                        self.storage,
+                        speech_urls,
+                        current_session,
+                        start_time,
+                        transport=self.transport,
+                        keep_text=bool(self.pool),
                     )
-                    speech_parser.parse()
+                    if self.pool:
+                        speech_parser.parse_async(self.pool)
+                        speech_parsers.append(speech_parser)
+                    else:
+                        speech_parser.parse()
+                        is_complete = is_complete and speech_parser.is_complete
+
+            if self.pool:
+                self.pool.drain()
+            self.link_sync.flush()
+            # parse the feed again on the next run if a transcript wasn't saved
+            is_complete = is_complete and all(
+                parser.is_complete for parser in speech_parsers
+            )
+            if not is_complete:
+                print(f"Not all transcripts of {url_group['file_name']} were saved")
+            if is_complete and not is_targeted:
+                self.feed_cache.mark_processed(feed)
 
     def get_session_type(self, type_text):
         type_text = type_text.lower().strip()
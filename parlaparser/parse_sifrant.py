@@ -2,11 +2,15 @@ import re
 from collections import defaultdict
 from datetime import datetime
 
-import requests
-import xmltodict
-
+from parlaparser.utils.feed_cache import FeedCache
+from parlaparser.utils.people import get_people_resolver
+from parlaparser.utils.transport import default_transport
+from parlaparser.utils.xml_stream import iter_records
 from settings import MANDATE_STARTIME
 
+# subject types, people, subjects and connections sections of SIF.XML
+SIF_RECORD_TAGS = ["TIP_SUBJEKTA", "OSEBA", "SUBJEKT_FUNKCIJA", "POVEZAVA"]
+
 
 class MembershipsParser(object):
 
@@ -26,13 +30,21 @@ class MembershipsParser(object):
         "dec": 12,
     }
 
-    def __init__(self, storage):
+    def __init__(self, storage, transport=None):
         self.storage = storage
+        self.transport = transport or default_transport
         self.storage.membership_storage.load_data()
         self.membership_storage = self.storage.membership_storage
+        self.feed_cache = FeedCache(transport=self.transport)
 
     def parse(self):
-        self.parse_document()
+        feed = self.feed_cache.fetch(
+            "https://fotogalerija.dz-rs.si/datoteke/opendata/SIF.XML", "SIF.XML"
+        )
+        if not feed.changed:
+            print("Skip unchanged feed SIF.XML")
+            return
+        self.parse_document(feed.path)
         self.prepare_data_structure()
         main_org = self.storage.organization_storage.get_organization_by_id(
             self.storage.main_org_id
@@ -40,8 +52,9 @@ class MembershipsParser(object):
         self.membership_storage.refresh_per_person_memberships(
             self.per_person_data, main_org
         )
+        self.feed_cache.mark_processed(feed)
 
-    def parse_document(self):
+    def parse_document(self, path):
 
         active_memberships = defaultdict(list)
 
@@ -80,189 +93,159 @@ class MembershipsParser(object):
             #'VSE': 'Head of Division - Secretary',
             #'VSL': 'Head of Office'
         }
-        connections = []
-        org_key_id = {}
-        ps_key_id = {}
         subject_types = {}
-        ps_keys = []
-
-        url = f"https://fotogalerija.dz-rs.si/datoteke/opendata/SIF.XML"
-        response = requests.get(url)
-        with open(f"/tmp/SIF.XML", "wb") as f:
-            f.write(response.content)
-        with open("/tmp/SIF.XML", "rb") as data_file:
-            data = xmltodict.parse(data_file, dict_constructor=dict)
-
-            print(data["SIF"].keys())
-
-            # load type of subjects
-            for tip in data["SIF"]["TIPI_SUBJEKTOV"]["TIP_SUBJEKTA"]:
-                tip_subjekta = self.get_root_or_text(tip["TIP_SUBJEKTA_NAZIV"], "AN")
-                subject_types[tip["TIP_SUBJEKTA_SIFRA"]] = tip_subjekta
-
-            """
-            D Drugo
-            DT Committee
-            F Funkcija
-            PS Deputy group
-            SD Stalna delegacija
-            SP Skupina prijateljstva
-            """
-
-            # connection_types are hardcoded for save just memberships which is needet for parlameter
-            # # load type of connections
-            # for tip in data['SIF']['TIPI_POVEZAV']['TIP_POVEZAVE']:
-            #     connection_types[tip['TIP_POVEZAVE_SIFRA']] = self.get_root_or_text(tip['TIP_POVEZAVE_NAZIV']['M'], 'AN')
-
-            # add people
-            print("Adding people")
-            for person in data["SIF"]["OSEBE"]["OSEBA"]:
-                # continue
-                name = f'{person["OSEBA_IME"]} {person["OSEBA_PRIIMEK"]}'
-
-                izkaznica_string = self.get_root_or_text(
-                    person["OSEBA_OSEBNA_IZKAZNICA"]
-                )
-                try:
-                    birth_date = self.parse_birth_string(izkaznica_string)
-                except:
-                    birth_date = None
-                # TODO create parsing gender [parladata api] person['OSEBA_SPOL']
-                # TODO okraj [parladata api] person['OSEBA_POSLANSKI_MANDAT']['POSLANSKI_MANDAT_OKRAJ_NAZIV']
-                # TODO update parsername with OSEBA_SIFRA if person exists
-                new_person = self.storage.people_storage.get_or_add_object(
-                    {
-                        "parser_names": f'{name}|{person["OSEBA_SIFRA"]}',
-                        "name": name,
-                        "date_of_birth": birth_date,
-                    }
-                )
-                # update existing person with GOV ID
-                # if not new_person.is_new:
-                #   new_person.add_parser_name(person["OSEBA_SIFRA"])
-
-            # add groups
-            print("Adding groups")
-            for group in data["SIF"]["SUBJEKTI_FUNKCIJE"]["SUBJEKT_FUNKCIJA"]:
-                subject_type_key = group["SUBJEKT_FUNKCIJA_TIP"]
-
-                # Skip subjects pf type [Drugo, Funkcija, Stalna Delegacija, Skupina poslank in poslancev]
-                if subject_type_key in ["D", "F", "SK"]:
-                    continue
-                subject_type_str = subject_types[subject_type_key]
-                name = self.get_root_or_text(group["SUBJEKT_FUNKCIJA_NAZIV"])
-                if "SUBJEKT_FUNKCIJA_DATUM_USTANOVITVE" in group.keys():
-                    founding_date = datetime.strptime(
-                        group["SUBJEKT_FUNKCIJA_DATUM_USTANOVITVE"], "%Y-%M-%d"
-                    ).isoformat()
-                else:
-                    None
-                acronym = group.get("SUBJEKT_FUNKCIJA_NAZIV", None)
-                if subject_type_key == "PS":
-                    group_data = {
-                        "name": f"{name}",
-                        "parser_names": f'{name}|{group["SUBJEKT_FUNKCIJA_SIFRA"]}',
-                        "gov_id": group["SUBJEKT_FUNKCIJA_SIFRA"],
-                        "classification": "pg",
-                        "founding_date": founding_date,
-                    }
-                    organization = self.storage.organization_storage.get_or_add_object(
-                        group_data,
+        groups = []
+        connections = []
+        people_resolver = get_people_resolver(self.storage)
+
+        print("Adding people")
+        for tag, record in iter_records(path, SIF_RECORD_TAGS):
+            if tag == "TIP_SUBJEKTA":
+                # load type of subjects
+                tip_subjekta = self.get_root_or_text(record["TIP_SUBJEKTA_NAZIV"], "AN")
+                subject_types[record["TIP_SUBJEKTA_SIFRA"]] = tip_subjekta
+            elif tag == "OSEBA":
+                self.add_person(record, people_resolver)
+            elif tag == "SUBJEKT_FUNKCIJA":
+                groups.append(record)
+            else:
+                # connections are resolved when all subjects are known
+                connections.append(
+                    (
+                        record["OSEBA_SIFRA"],
+                        record["SUBJEKTI_FUNKCIJA_SIFRA"],
+                        record["POVEZAVA_SIFRA"],
                     )
-                    ps_key_id[group["SUBJEKT_FUNKCIJA_SIFRA"]] = organization.id
-
-                classification = group_classifications[subject_type_str.lower()]
-                if classification not in ["committee", "friendship_group"]:
-                    continue
+                )
 
+        """
+        D Drugo
+        DT Committee
+        F Funkcija
+        PS Deputy group
+        SD Stalna delegacija
+        SP Skupina prijateljstva
+        """
+
+        # connection_types are hardcoded for save just memberships which is needet for parlameter
+        # # load type of connections
+        # for tip in data['SIF']['TIPI_POVEZAV']['TIP_POVEZAVE']:
+        #     connection_types[tip['TIP_POVEZAVE_SIFRA']] = self.get_root_or_text(tip['TIP_POVEZAVE_NAZIV']['M'], 'AN')
+
+        # add groups
+        print("Adding groups")
+        organizations = {}
+        ps_keys = set()
+        for group in groups:
+            subject_type_key = group["SUBJEKT_FUNKCIJA_TIP"]
+
+            # Skip subjects pf type [Drugo, Funkcija, Stalna Delegacija, Skupina poslank in poslancev]
+            if subject_type_key in ["D", "F", "SK"]:
+                continue
+            subject_type_str = subject_types[subject_type_key]
+            name = self.get_root_or_text(group["SUBJEKT_FUNKCIJA_NAZIV"])
+            if "SUBJEKT_FUNKCIJA_DATUM_USTANOVITVE" in group.keys():
+                founding_date = datetime.strptime(
+                    group["SUBJEKT_FUNKCIJA_DATUM_USTANOVITVE"], "%Y-%M-%d"
+                ).isoformat()
+            else:
+                None
+            acronym = group.get("SUBJEKT_FUNKCIJA_NAZIV", None)
+            if subject_type_key == "PS":
                 group_data = {
                     "name": f"{name}",
                     "parser_names": f'{name}|{group["SUBJEKT_FUNKCIJA_SIFRA"]}',
                     "gov_id": group["SUBJEKT_FUNKCIJA_SIFRA"],
-                    "classification": classification,
+                    "classification": "pg",
                     "founding_date": founding_date,
                 }
-                if acronym:
-                    group_data.update({"acronym": acronym})
                 organization = self.storage.organization_storage.get_or_add_object(
                     group_data,
                 )
-                org_key_id[group["SUBJEKT_FUNKCIJA_SIFRA"]] = organization.id
-
-            # add memberships
-            print("Adding memberships")
-            org_keys = org_key_id.keys()
-            ps_keys = ps_key_id.keys()
-
-            org_key_id.update(ps_key_id)
-            self.per_person_data = defaultdict(lambda: defaultdict(list))
-            for connection in data["SIF"]["POVEZAVE"]["POVEZAVA"]:
-                # skip adding membership if subject type is in [Drugo, Funkcija, Stalna Delegacija]
-                if connection["SUBJEKTI_FUNKCIJA_SIFRA"] in ps_keys:
-                    typ = "party"
-                elif connection["SUBJEKTI_FUNKCIJA_SIFRA"] in org_keys:
-                    typ = "committee"
-                else:
-                    continue
-
-                ha = False
+                organizations[group["SUBJEKT_FUNKCIJA_SIFRA"]] = organization
+                ps_keys.add(group["SUBJEKT_FUNKCIJA_SIFRA"])
+
+            classification = group_classifications[subject_type_str.lower()]
+            if classification not in ["committee", "friendship_group"]:
+                continue
+
+            group_data = {
+                "name": f"{name}",
+                "parser_names": f'{name}|{group["SUBJEKT_FUNKCIJA_SIFRA"]}',
+                "gov_id": group["SUBJEKT_FUNKCIJA_SIFRA"],
+                "classification": classification,
+                "founding_date": founding_date,
+            }
+            if acronym:
+                group_data.update({"acronym": acronym})
+            organization = self.storage.organization_storage.get_or_add_object(
+                group_data,
+            )
+            if group["SUBJEKT_FUNKCIJA_SIFRA"] not in ps_keys:
+                organizations[group["SUBJEKT_FUNKCIJA_SIFRA"]] = organization
+
+        # add memberships
+        print("Adding memberships")
+        self.per_person_data = defaultdict(lambda: defaultdict(list))
+        for person_gov_id, org_gov_id, connection_type in connections:
+            # skip adding membership if subject type is in [Drugo, Funkcija, Stalna Delegacija]
+            organization = organizations.get(org_gov_id)
+            if not organization:
+                continue
+            if org_gov_id in ps_keys:
+                typ = "party"
+            else:
+                typ = "committee"
 
-                person_gov_id = connection["OSEBA_SIFRA"]
-                org_gov_id = connection["SUBJEKTI_FUNKCIJA_SIFRA"]
+            # dont add memberships for people which not in ['SIF']['OSEBE']
+            person = people_resolver.find(person_gov_id)
+            if not person:
+                continue
 
-                if person_gov_id == "P415" and org_gov_id == "PS036":
-                    print("Gotcha")
-                    ha = True
-                # print(person_gov_id, org_gov_id)
+            if organization.classification == "friendship_group":
+                is_voter = False
+            else:
+                is_voter = True
 
-                person = self.storage.people_storage.get_or_add_object(
-                    {"name": person_gov_id},
-                    add=False,
+            role = connection_types.get(connection_type, None)
+            if role:
+                self.per_person_data[person.id][typ].append(
+                    {
+                        "is_voter": is_voter,
+                        "member": person,
+                        "organization": organization,
+                        "on_behalf_of": None,
+                        "role": role,
+                        "type": typ,
+                        "mandate": self.storage.mandate_id,
+                    }
                 )
-                # dont add memberships for people which not in ['SIF']['OSEBE']
-                if not person:
-                    continue
+        print(f"Added memberships of {len(self.per_person_data)} people")
 
-                # organization = self.storage.organization_storage.get_or_add_object(
-                #     org_gov_id
-                # )
-                org_id = org_key_id.get(org_gov_id)
-                if not org_id:
-                    print("Organization not found", org_gov_id)
-                    continue
-                organization = self.storage.organization_storage.get_organization_by_id(
-                    org_id,
-                )
-                if organization.classification == "friendship_group":
-                    is_voter = False
-                else:
-                    is_voter = True
+    def add_person(self, person, people_resolver):
+        name = f'{person["OSEBA_IME"]} {person["OSEBA_PRIIMEK"]}'
 
-                role = connection_types.get(connection["POVEZAVA_SIFRA"], None)
-                if role:
-                    print("Add or get person")
-                    self.per_person_data[person.id][typ].append(
-                        {
-                            "is_voter": is_voter,
-                            "member": person,
-                            "organization": organization,
-                            "on_behalf_of": None,
-                            "role": role,
-                            "type": typ,
-                            "mandate": self.storage.mandate_id,
-                        }
-                    )
-                if ha:
-                    print(
-                        {
-                            "is_voter": True,
-                            "member": person,
-                            "organization": organization,
-                            "role": role,
-                            "type": typ,
-                        },
-                        person.id,
-                    )
+        izkaznica_string = self.get_root_or_text(person["OSEBA_OSEBNA_IZKAZNICA"])
+        try:
+            birth_date = self.parse_birth_string(izkaznica_string)
+        except:
+            birth_date = None
+        # TODO create parsing gender [parladata api] person['OSEBA_SPOL']
+        # TODO okraj [parladata api] person['OSEBA_POSLANSKI_MANDAT']['POSLANSKI_MANDAT_OKRAJ_NAZIV']
+        # TODO update parsername with OSEBA_SIFRA if person exists
+        new_person = people_resolver.find(name)
+        if not new_person:
+            new_person = self.storage.people_storage.get_or_add_object(
+                {
+                    "parser_names": f'{name}|{person["OSEBA_SIFRA"]}',
+                    "name": name,
+                    "date_of_birth": birth_date,
+                }
+            )
+        # update existing person with GOV ID
+        # if not new_person.is_new:
+        #   new_person.add_parser_name(person["OSEBA_SIFRA"])
+        return new_person
 
     def prepare_data_structure(self):
         self.membership_storage.temporary_data = self.per_person_data
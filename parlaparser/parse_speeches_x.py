@@ -5,7 +5,20 @@ from enum import Enum
 import sentry_sdk
 from lxml import etree, html
 
-from parlaparser.utils.methods import get_with_retry
+from parlaparser.utils.line_classifier import LineClassifier
+from parlaparser.utils.methods import get_many_with_retry
+from parlaparser.utils.names import fix_name, is_valid_name
+from parlaparser.utils.people import get_people_resolver
+from parlaparser.utils.speech_diff import diff_speeches
+from parlaparser.utils.transcript_lines import iter_lines
+from parlaparser.utils.transcript_manifest import (
+    TranscriptManifest,
+    get_page_fingerprint,
+    get_page_hash,
+    get_speech_fingerprint,
+)
+from parlaparser.utils.transport import default_transport
+from settings import SPEECH_SYNC_MAX_CHANGES
 
 
 class ParserState(Enum):
@@ -22,9 +35,6 @@ TEST_TRANSCRIPT_URL = "https://www.dz-rs.si/wps/portal/Home/seje/evidenca/!ut/p/
 
 class SpeechParser(object):
     # regexi
-    ANY_SPACES_BETWEEN_B_TAGS = r"</b>(\s*)<b>"
-    ANY_EMPTY_B_TAGS = r"<b>(\s*)</b>"
-    BR_TAG = r"<br\s*/?>"
     REGEX_IS_START_OF_CONTENT = r"[Ss]eja .{5,14} (ob)?\s?\d{1,2}"
     REGEX_START_WIERD_WB_SESSION = r"Odprti .{3} seje se je začel ob \d\d"
     DATE_TIME_REGEX = (
@@ -51,33 +61,63 @@ class SpeechParser(object):
 
     DEBUG = False
 
-    # data
-    page_content = []
-    meta = []
-    current_text = []
-    current_person = None
-    date_of_sitting = None
-
-    def __init__(self, storage, urls, session, start_date, debug=False):
+    def __init__(
+        self,
+        storage,
+        urls,
+        session,
+        start_date,
+        debug=False,
+        transport=None,
+        load=True,
+        keep_text=False,
+    ):
         self.urls = urls
+        # raw html of pages is kept only for parse_async
+        self.keep_text = keep_text
+        self.transport = transport or default_transport
         self.storage = storage
         self.session = session
         self.start_date = start_date
         self.session_start_time = None
         self.page_htmls = []
-        self.pages = []
+        # fingerprints of pages with speeches from this transcript
+        self.page_fingerprints = set()
         self.titles = []
         self.page_in_review = []
+        self.last_added_index = None
+        # False if saving stopped at a page which couldn't be read
+        self.is_complete = True
+        self.manifest = None
+        self.stored_pages = []
+        # state of the page which is parsed
+        self.page_idx = 0
+        self.page_content = []
+        self.meta = []
+        self.current_text = []
+        self.current_person = None
+        self.date_of_sitting = None
+        self.sitting_start_time = None
         self.DEBUG = debug
-        self.read_files()
-        self.in_review_controller()
+        self.classifier = LineClassifier(self)
+        if load:
+            self.read_files()
+            self.in_review_controller()
 
     def read_files(self):
-        for url in self.urls:
+        # pages are downloaded concurrently but kept in order of self.urls,
+        # because speech order continues from page to page
+        responses = get_many_with_retry(self.urls, transport=self.transport)
+        for url, response in zip(self.urls, responses):
             print(f"Opening speeches from url: {url}")
-            speeches_content = get_with_retry(url).text
-            htree = html.fromstring(speeches_content)
-            self.page_htmls.append({"url": url, "tree": htree})
+            htree = html.fromstring(response.text)
+            page = {
+                "url": url,
+                "tree": htree,
+                "text": response.text if self.keep_text else None,
+                "sha256": get_page_hash(htree),
+            }
+            self.page_htmls.append(page)
             title = self.parse_title(htree)
             self.titles.append(title)
             if "v pregled" in title.lower():
@@ -88,6 +128,7 @@ class SpeechParser(object):
     def in_review_controller(self):
         self.parse_all_speeches = False
         self.parse_new_speeches = False
+        self.resync_speeches = False
         if self.DEBUG:
             self.parse_all_speeches = True
             return
@@ -97,14 +138,10 @@ class SpeechParser(object):
             )
         session_in_review = any(self.page_in_review)
         if not session_in_review and was_session_in_review:
-            # set session to not in review
-            if self.session.in_review:
-                self.session.patch_session({"in_review": False})
-            # unvalidate speeches
-            self.session.unvalidate_speeches()
-
-            # TODO parse new speeches
+            # final speeches are synced with the speeches parsed in review,
+            # the session is set to not in review after the sync
             self.parse_all_speeches = True
+            self.resync_speeches = True
         elif session_in_review and not was_session_in_review:
             # set session to not in review
             self.parse_new_speeches = True
@@ -123,23 +160,8 @@ class SpeechParser(object):
     def update_session_start_time(self, time):
         """set session start time if not set yet"""
         if not self.session.start_time:
-            start_date = None
-            if self.page_htmls:
-                htree = self.page_htmls[0]["tree"]
-                # gat date of sitting: '6. 10. 2025'
-                maybe_date_element = htree.cssselect("table td")
-                if maybe_date_element:
-                    start_date = maybe_date_element[-1].text
-                else:
-                    maybe_date_element = htree.cssselect("form>div>div")
-                    if maybe_date_element:
-                        maybe_date = " ".join(
-                            [self.tostring_unwraped(i) for i in maybe_date_element]
-                        )
-                        dates = re.findall(self.DATE_REGEX, maybe_date)
-                        if dates:
-                            start_date = dates[0]
-
+            # date of sitting of the first page: '6. 10. 2025'
+            start_date = self.date_of_sitting
             if start_date:
                 new_start = datetime.strptime(start_date, "%d. %m. %Y")
             else:
@@ -162,67 +184,207 @@ class SpeechParser(object):
                 print(e)
                 pass
 
-    def parse(self):
+    def needs_parsing(self):
         if not (self.parse_all_speeches or self.parse_new_speeches):
             print("No need to parse speeches")
-            return
+            return False
+        return True
+
+    def get_first_page_to_parse(self):
+        """
+        return index of the first page which has to be parsed and the order of
+        the last speech before it
+        """
         start_order = 0
+        if self.parse_new_speeches:
+            self.last_added_index = self.session.get_speech_count()
+            print(f"Session has {self.last_added_index} speeches")
+        else:
+            self.last_added_index = None
+
+        self.manifest = None if self.DEBUG else TranscriptManifest(self.session.id)
+        # the manifest is rewritten while saving, keep pages of the last run
+        self.stored_pages = list(self.manifest.pages) if self.manifest else []
+        if not (self.parse_new_speeches and self.manifest):
+            return 0, start_order
+
+        # in review sessions continue at the first page which changed
         for idx, page in enumerate(self.page_htmls):
-            print(f"Parsing speeches from url: {page['url']}")
-            htree = page["tree"]
-            self.page_idx = idx
-            self.page_content = []
-            self.meta = []
-            self.current_text = []
-            self.current_person = None
-            self.date_of_sitting = None
-
-            err_mgs = htree.cssselect("form span.wcmLotusMessage")
-
-            if err_mgs and err_mgs[0].text == "Podatki dokumenta so nedostopni.":
-                print("---_____retry another document ________------")
-                return
+            parsed_page = self.manifest.get_unchanged_page(
+                idx, page["url"], page["sha256"]
+            )
+            if not parsed_page or parsed_page["last_order"] > self.last_added_index:
+                return idx, start_order
+            print(f"Skip unchanged speeches page: {page['url']}")
+            start_order = parsed_page["last_order"]
+            if parsed_page.get("fingerprint"):
+                self.page_fingerprints.add(parsed_page["fingerprint"])
+        return len(self.page_htmls), start_order
+
+    def parse(self):
+        if not self.needs_parsing():
+            return
+        first_index, start_order = self.get_first_page_to_parse()
+        results = (
+            self.parse_page(page["tree"], idx)
+            for idx, page in enumerate(self.page_htmls)
+            if idx >= first_index
+        )
+        self.save_pages(first_index, start_order, results)
+
+    def parse_async(self, pool):
+        """
+        parse pages in a worker process of the pool, speeches are saved when
+        the pool hands back the results, the parser has to be created with
+        keep_text
+        """
+        if not self.needs_parsing():
+            return
+        first_index, start_order = self.get_first_page_to_parse()
+        pages = [
+            (idx, page["text"])
+            for idx, page in enumerate(self.page_htmls)
+            if idx >= first_index
+        ]
+        # workers build their own trees
+        for page in self.page_htmls:
+            self.release_page(page)
+        pool.submit(
+            parse_transcript_pages,
+            pages,
+            lambda results: self.save_pages(first_index, start_order, results),
+        )
 
-            # gat date of sitting
-            maybe_date_element = htree.cssselect("table td")
+    def parse_page(self, htree, idx):
+        """
+        parse one transcript page without touching the storage and return
+        its speeches, meta lines, date of sitting and start time
+        """
+        print(f"Parsing speeches from page: {idx}")
+        self.page_idx = idx
+        self.page_content = []
+        self.meta = []
+        self.current_text = []
+        self.current_person = None
+        self.date_of_sitting = None
+        self.sitting_start_time = None
+
+        err_mgs = htree.cssselect("form span.wcmLotusMessage")
+
+        if err_mgs and err_mgs[0].text == "Podatki dokumenta so nedostopni.":
+            return None
+
+        # gat date of sitting
+        maybe_date_element = htree.cssselect("table td")
+        if maybe_date_element:
+            self.date_of_sitting = maybe_date_element[-1].text
+        else:
+            maybe_date_element = htree.cssselect("form>div>div")
             if maybe_date_element:
-                self.date_of_sitting = maybe_date_element[-1].text
-            else:
-                maybe_date_element = htree.cssselect("form>div>div")
-                if maybe_date_element:
-                    maybe_date = " ".join(
-                        [self.tostring_unwraped(i) for i in maybe_date_element]
-                    )
-                    dates = re.findall(self.DATE_REGEX, maybe_date)
-                    if dates:
-                        self.date_of_sitting = dates[0]
+                maybe_date = " ".join(
+                    [self.tostring_unwraped(i) for i in maybe_date_element]
+                )
+                dates = re.findall(self.DATE_REGEX, maybe_date)
+                if dates:
+                    self.date_of_sitting = dates[0]
 
-            title = self.parse_title(htree)
-            self.titles.append(title)
-            if "v pregled" in title.lower():
-                self.page_in_review.append(True)
-            else:
-                self.page_in_review.append(False)
+        self.parse_content(htree)
+
+        speech_fingerprints = [
+            get_speech_fingerprint(speech) for speech in self.page_content
+        ]
+        return {
+            "fingerprint": get_page_fingerprint(speech_fingerprints),
+            "speech_fingerprints": speech_fingerprints,
+            "page_content": self.page_content,
+            "meta": self.meta,
+            "date_of_sitting": self.date_of_sitting,
+            "sitting_start_time": self.sitting_start_time,
+        }
+
+    def is_republished_page(self, idx, fingerprint, start_order):
+        """
+        page changed on the portal but has the same speeches at the same
+        orders as when it was saved, for sessions in review
+        """
+        if not self.parse_new_speeches or idx >= len(self.stored_pages):
+            return False
+        stored_page = self.stored_pages[idx]
+        stored_start_order = self.stored_pages[idx - 1]["last_order"] if idx else 0
+        return (
+            stored_page.get("fingerprint") == fingerprint
+            and stored_start_order == start_order
+            and stored_page["last_order"] <= self.last_added_index
+        )
+
+    def release_page(self, page):
+        page["tree"] = None
+        page["text"] = None
 
-            self.parse_content(htree)
+    def save_pages(self, first_index, start_order, results):
+        """
+        save parsed pages in order, results are parse_page outputs of the
+        pages from first_index on
+        """
+        final_speeches = []
+        for idx, result in enumerate(results, start=first_index):
+            page = self.page_htmls[idx]
+            if result is None:
+                print("---_____retry another document ________------")
+                self.is_complete = False
+                return
+            self.page_content = result["page_content"]
+            self.meta = result["meta"]
+            self.date_of_sitting = result["date_of_sitting"]
 
-            if self.parse_new_speeches:
-                last_added_index = self.session.get_speech_count()
-                print(f"Session has {last_added_index} speeches")
+            if idx == 0 and result["sitting_start_time"]:
+                self.update_session_start_time(result["sitting_start_time"])
+
+            # prevent to adding speeches form two equals documents
+            fingerprint = result["fingerprint"]
+            if fingerprint in self.page_fingerprints:
+                self.page_content = []
             else:
-                last_added_index = None
+                self.page_fingerprints.add(fingerprint)
 
-            print(f"document has {len(self.page_content)} speeches")
-            if not self.DEBUG:
-                start_order = self.save_speeches(
-                    start_order,
-                    last_added_index,
-                    self.session.start_time,
+            if self.is_republished_page(idx, fingerprint, start_order):
+                print(f"Skip re-published speeches page: {page['url']}")
+                start_order = self.stored_pages[idx]["last_order"]
+                self.manifest.set_page(
+                    idx, page["url"], page["sha256"], start_order, fingerprint
                 )
+                self.release_page(page)
+                continue
+
+            print(f"document {page['url']} has {len(self.page_content)} speeches")
+            if not self.DEBUG:
+                if self.resync_speeches:
+                    speech_objs, start_order = self.build_speeches(
+                        start_order, session_start_time=self.session.start_time
+                    )
+                    if speech_objs is not None:
+                        final_speeches.extend(speech_objs)
+                else:
+                    start_order = self.save_speeches(
+                        start_order,
+                        self.last_added_index,
+                        self.session.start_time,
+                    )
+                if start_order is not None:
+                    self.manifest.set_page(
+                        idx, page["url"], page["sha256"], start_order, fingerprint
+                    )
+            self.release_page(page)
             # Dont parse next spech page if cureent isn't valid
             if start_order == None:
+                self.is_complete = False
                 break
 
+        if self.resync_speeches and start_order is not None:
+            self.sync_speeches(final_speeches)
+            if self.session.in_review:
+                self.session.patch_session({"in_review": False})
+
     # getters
     def get_content(self):
         return self.page_content
@@ -278,78 +440,54 @@ class SpeechParser(object):
         except:
             return
         etree.strip_tags(output_text, "font")
-        output_text_string = self.tostring_unwraped(output_text)
-        output_text_string = re.sub(
-            self.ANY_SPACES_BETWEEN_B_TAGS, "\\1", output_text_string, 0, re.MULTILINE
-        )
-        output_text_string = re.sub(
-            self.ANY_EMPTY_B_TAGS, "\\1", output_text_string, 0, re.MULTILINE
-        )
-        lines = re.split(self.BR_TAG, output_text_string, 0, re.MULTILINE)
-        lines = list(map(str.strip, lines))
-        if self.DEBUG:
-            # lines = lines[:50]
-            pass
 
         self.state = ParserState.META
         self.current_person = None
         self.current_text = []
 
-        for line in lines:
-            line_tree = html.fromstring(f"<span>{line}</span>")
-
+        for line in iter_lines(output_text):
             if self.DEBUG:
                 print("---")
                 print(self.state)
                 print(line)
-                print(line_tree)
-                print(line_tree.text_content())
 
-            if self.find_trak(line_tree):
+            if self.find_trak(line):
                 continue
 
-            if self.skip_line_if_needed(line_tree.text_content()):
+            if self.skip_line_if_needed(line.text):
                 continue
 
             if self.state == ParserState.META:
-                self.meta.append(line_tree.text_content())
-                if (
-                    re.search(self.REGEX_IS_START_OF_CONTENT, line, re.IGNORECASE)
-                    or line.startswith("Besedilo je objavljeno")
-                    or re.search(self.REGEX_START_WIERD_WB_SESSION, line, re.IGNORECASE)
-                    or re.search(self.DATE_TIME_REGEX, line)
-                ):
+                self.meta.append(line.text)
+                if self.classifier.is_start_of_content(line.text):
                     self.state = ParserState.PRE_CONTENT
                     if self.DEBUG:
                         continue
                     if self.page_idx == 0:
-                        time = self.get_time_from_line(line)
+                        time = self.get_time_from_line(line.text)
                         print(time)
                         if "time" in time.keys():
-                            self.update_session_start_time(time["time"])
+                            # saved together with the speeches
+                            self.sitting_start_time = time["time"]
 
             elif self.state == ParserState.NAME:
-                self.parse_person_line(line_tree)
+                self.parse_person_line(line)
 
             elif self.state == ParserState.CONTENT:
-                self.parse_text_line(line_tree)
+                self.parse_text_line(line)
 
             elif self.state == ParserState.PRE_CONTENT:
-                if not line.strip():
+                if line.is_empty:
                     continue
                 else:
-                    self.parse_person_line(line_tree)
+                    self.parse_person_line(line)
             elif self.state == ParserState.TRAK:
-                # work on original line (with bold tags)
-                temp_line = line
-                if not temp_line.strip():
+                if line.is_empty:
                     continue
                 for skip_word in self.TRACK_CONTINUE_WORDS:
-                    if temp_line.startswith(skip_word):
-                        temp_line = temp_line[len(skip_word) :]
-                        line_tree = html.fromstring(f"<span>{temp_line}</span>")
+                    line = line.without_prefix(skip_word)
 
-                self.parse_person_line(line_tree)
+                self.parse_person_line(line)
 
         if self.current_person and self.current_text:
             self.page_content.append(
@@ -359,12 +497,6 @@ class SpeechParser(object):
                 }
             )
 
-        # prevent to adding speeches form two equals documents
-        if self.page_content in self.pages:
-            self.page_content = []
-        else:
-            self.pages.append(self.page_content)
-
     def tostring_unwraped(self, element):
         string = element.text or ""
         for child in element.getchildren():
@@ -372,25 +504,24 @@ class SpeechParser(object):
         string += element.tail or ""
         return string
 
-    def parse_person_line(self, line_tree):
+    def parse_person_line(self, line):
         """
         try to find person name in line if not found parse line as text
         """
-        line = line_tree.text_content()
-        if not line.strip():
+        if not line.text.strip():
             self.state = ParserState.NAME
             return
         if self.DEBUG:
-            print("Trying to find speaker in line:", line)
-        name_candidate = line_tree.cssselect("b")
+            print("Trying to find speaker in line:", line.text)
         speaker = None
-        if name_candidate:
+        if line.has_bold:
+            name_candidate = line.bold
             if self.DEBUG:
                 print(f"Found bolded text: {name_candidate}")
             # check if bolded text is valid person name
             try:
-                name_candidate = name_candidate[0].text.strip()
-                match = re.match(self.FIND_NAME, name_candidate)
+                name_candidate = name_candidate.strip()
+                match = self.classifier.match_name(name_candidate)
                 person_line = None
                 if match:
                     person_line = match.group("ime")
@@ -402,9 +533,6 @@ class SpeechParser(object):
                 person_line = ""
                 if self.DEBUG:
                     print(name_candidate)
-                    print(name_candidate[0])
-                    print(name_candidate[0].text_content())
-                    print(name_candidate[0].text)
                 mister_or_madam_line = ""
                 minister_line = ""
                 print('fail find person with "name"', e)
@@ -431,26 +559,19 @@ class SpeechParser(object):
                     self.current_text = []
 
                 self.current_person = speaker
-                try:
-                    text = line_tree.cssselect("span")[0].getchildren()[0].tail.strip()
-                    self.current_text.append(text)
-                except:
-                    pass
+                if line.tail is not None:
+                    self.current_text.append(line.tail.strip())
                 self.state = ParserState.CONTENT
             else:
-                self.parse_text_line(line_tree)
+                self.parse_text_line(line)
                 self.state = ParserState.CONTENT
         else:
-            self.parse_text_line(line_tree)
+            self.parse_text_line(line)
             self.state = ParserState.CONTENT
 
-    def parse_text_line(self, line_tree):
-        line = line_tree.text_content()
-        if re.findall(self.FIND_SESSION_PAUSE, line):
-            return
-        if re.findall(self.FIND_END_OF_SESSION, line):
-            return
-        if re.search(self.DATE_TIME_REGEX, line):
+    def parse_text_line(self, line):
+        line = line.text
+        if self.classifier.is_session_note(line):
             return
 
         line = line.lstrip("(nadaljevanje)")
@@ -463,12 +584,11 @@ class SpeechParser(object):
             else:
                 self.current_text.append(line)
 
-    def find_trak(self, line_tree):
-        bold = line_tree.cssselect("b")
-        if bold:
-            trak_candidat = bold[0].text
+    def find_trak(self, line):
+        if line.has_bold:
+            trak_candidat = line.bold
             if isinstance(trak_candidat, str):
-                if re.search(self.FIND_TRAK, trak_candidat):
+                if self.classifier.is_trak(trak_candidat):
                     self.state = ParserState.TRAK
                     return True
         return False
@@ -482,150 +602,67 @@ class SpeechParser(object):
             self.current_text.append(text)
 
     def skip_line_if_needed(self, text):
-        if re.search(self.SKIP_SESSION_PAUSE, text):
+        if self.classifier.is_skipped_pause(text):
             return True
         else:
             return False
 
     def is_valid_name(self, full_name):
-        """
-        Checker for valid names
-        Name is unvalid if;
-            * if combiend form more 5 words
-            * contains forbiden words
-        """
-        full_name = full_name.strip()
-        if len(full_name.split(" ")) > 5:
-            return False
-        lower_name = full_name.lower()
-        forbiden_name_words = [
-            "obravnav",
-            "postopka",
-            "zakona",
-            "prekinjena",
-            "vprašanja",
-            "davku",
-            "prehajamo",
-            "dnevnega",
-            "poročilo",
-            "problematika",
-            "evropske",
-            "evropsko",
-            "administrativne",
-            "predstavitev",
-            "industrijski",
-            "nalezljivih",
-            "predlogu",
-            "skupno",
-            "obvestilo",
-            "omenjene",
-            "gospodarstvu",
-            "neonacizem",
-            "negospodarnega",
-            "nadzor",
-            "sodišča",
-            "prisilni",
-            "slovenije",
-            "madžarkskega",
-            "predlog",
-            "dogovor",
-            "proračuna",
-            "onesnaženost",
-            "problematiko",
-            "aktualne",
-            "zakonsko",
-            "predkazenskih",
-            "postopkov",
-            "zoper",
-            "seznanitev",
-        ]
-        for word in forbiden_name_words:
-            if word in lower_name:
-                return False
-        return True
+        return is_valid_name(full_name)
 
     def fix_name(self, full_name):
-        full_name = full_name.strip()
-        remove_from_name = [
-            "PREDSEDNIK ",
-            "PREDSENDIK ",
-            "PODPREDSEDNIK ",
-            "PODPREDSENIK ",
-            "PODPREDSEDNICA ",
-            "PREDSEDIK ",
-            "POD ",
-            "PREDSEDNICA ",
-            "PREDSEDUJOČI ",
-            "PRESEDNICA ",
-            "POPDREDSEDNIK ",
-            "PREDSENICA ",
-            "PRESEDNIK ",
-            "PRESDEDNIK ",
-            "REDSEDNIK ",
-            "PREDSEDDNICA ",
-            "PEDSEDNIK ",
-            "PREDEDNIK ",
-            "PREDSEDNK ",
-            "REDSEDNICA ",
-            "PREDSDNIK ",
-            "DSEDNIK ",
-            "PREDEDNICA ",
-            "PREDSENIK ",
-            "PREDSENDICA ",
-            "PRDSEDNIK ",
-            "PREDSEDNCA ",
-            "PRDSEDNICA ",
-            "PREDSEDNNICA ",
-            "PREDSEDNI ",
-            "Nadaljevanje",
-            "nadaljevanje",
-            "PREDSEDINK ",
-            "PODPREDSEDINCA ",
-            "PODPRDSEDNICA ",
-            "PODPREDSEDICA ",
-            "PODPREDSEDNI ",
-            "PPREDSEDNIK ",
-            "PREDSEDNIKCA ",
-            "PODPPREDSEDNIK ",
-            "PREDSEDNIKA ",
-            "PREEDSEDNIK ",
-            "PODPREDSDNICA ",
-            "POPREDSEDNICA ",
-            "PREDSEDSEDNIK ",
-            "PODPREDSENDIK ",
-            "PREDSEDNIKI ",
-            "PODPRDSEDNIK ",
-            "PODPPREDSEDNICA ",
-            "PPODPREDSEDNI ",
-            "PODPEDSEDNIK ",
-            "PODREDSEDNIK ",
-            "PODPREDSEDNCA ",
-            "PODPREDSENICA ",
-            "PODPREDSEDNK ",
-            "PODPREDSDNIK ",
-            "PODREDSEDNICA ",
-            "PODPRESEDNICA ",
-            "PREDSEDINCA ",
-            "PREDSEDNCIA ",
-            "PREDSDEDNIK ",
-            "PREDSEDDNIK ",
-            "PREDESEDNIK ",
-            "PREDSDENIK ",
-            "PREDESENIK ",
-            "PREDSEDICA ",
-            "DPREDSEDNIK ",
-            "EDSEDNIK ",
-            "PODPREDEDNIK ",
-        ]
-        for word in remove_from_name:
-            if full_name.startswith(word):
-                full_name = full_name.replace(word, "").strip()
-        return full_name
+        return fix_name(full_name)
 
     # save SPEECHES
     def save_speeches(
         self, start_order, last_added_index=None, session_start_time=None
     ):
+        speech_objs, the_order = self.build_speeches(
+            start_order, last_added_index, session_start_time
+        )
+        if speech_objs is None:
+            return None
+        self.session.add_speeches(speech_objs)
+        print(f"Added speeches: {len(speech_objs)}")
+        return the_order
+
+    def sync_speeches(self, speeches):
+        """
+        apply only the differences between the final transcript and the
+        speeches which were parsed while the session was in review
+        """
+        valid_on = datetime.now().date().strftime("%Y-%m-%d")
+        stored_speeches = list(
+            self.storage.parladata_api.speeches.get_all(
+                session=self.session.id, valid_on=valid_on
+            )
+        )
+        inserts, updates, deletes = diff_speeches(stored_speeches, speeches)
+        print(
+            f"Sync speeches: {len(inserts)} inserts, {len(updates)} updates, "
+            f"{len(deletes)} deletes"
+        )
+        changes = len(inserts) + len(updates) + len(deletes)
+        if changes > SPEECH_SYNC_MAX_CHANGES * len(stored_speeches):
+            # shifted orders touch most of the session, save it again in bulk
+            print("Too many changed speeches, add all speeches again")
+            self.session.unvalidate_speeches()
+            self.session.add_speeches(speeches)
+            return
+        valid_to = datetime.now().isoformat()
+        for speech_id in deletes:
+            self.storage.parladata_api.speeches.patch(speech_id, {"valid_to": valid_to})
+        for speech_id, data in updates:
+            self.storage.parladata_api.speeches.patch(speech_id, data)
+        self.session.add_speeches(inserts)
+
+    def build_speeches(
+        self, start_order, last_added_index=None, session_start_time=None
+    ):
+        """
+        return speeches of the current page ready for saving and the order of
+        the last one, (None, None) if the page content can't be read
+        """
         extract_date_reg = r"\((.*?)\)"
         the_order = start_order
 
@@ -651,15 +688,17 @@ class SpeechParser(object):
                 print("[ERROR] Cannot read session content")
                 print(self.page_content)
                 # TODO send error
-                return None
+                return None, None
+
+        people = get_people_resolver(self.storage).resolve_many(
+            [speech["person"].strip() for speech in self.page_content]
+        )
 
         speech_objs = []
         skipped_speeches = 0
         for order, speech in enumerate(self.page_content):
             the_order = start_order + order + 1
-            person = self.storage.people_storage.get_or_add_object(
-                {"name": speech["person"].strip()}
-            )
+            person = people[speech["person"].strip()]
 
             # skip adding speech if has lover and equal order than last_added_index [for sessions in review]
             if last_added_index and the_order <= last_added_index:
@@ -689,10 +728,8 @@ class SpeechParser(object):
                     "start_time": start_time,
                 }
             )
-        self.session.add_speeches(speech_objs)
-        print(f"Added speeches: {len(speech_objs)}")
         print(f"Skipped speeches: {skipped_speeches}")
-        return the_order
+        return speech_objs, the_order
 
     def get_time_from_match(self, match):
         hour, minute = match.group(1, 2)
@@ -717,5 +754,14 @@ class SpeechParser(object):
         return (dt.hour, dt.minute, dt.second, dt.microsecond) == (0, 0, 0, 0)
 
 
+def parse_transcript_pages(pages):
+    """
+    parse (index, html) pages of one transcript, runs in a worker process so
+    it has no storage and downloads nothing
+    """
+    parser = SpeechParser(None, [], None, None, load=False)
+    return [parser.parse_page(html.fromstring(text), idx) for idx, text in pages]
+
+
 if __name__ == "__main__":
     speech_parser = SpeechParser(None, [TEST_TRANSCRIPT_URL], None, None, debug=True)
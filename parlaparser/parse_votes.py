@@ -2,23 +2,65 @@ from datetime import datetime
 from enum import Enum
 from urllib import parse
 
-import requests
 import sentry_sdk
 from lxml import html
 
+from parlaparser.utils.ballots import get_ballot_pipeline
+from parlaparser.utils.methods import get_many_with_retry
+from parlaparser.utils.motions import get_parsed_motion_index
+from parlaparser.utils.people import get_people_resolver
+from parlaparser.utils.rollcall import get_roll_call_matrix
+from parlaparser.utils.transport import default_transport
 from settings import BASE_URL
 
 
 class VotesParser(object):
-    def __init__(self, storage, session):
+    def __init__(self, storage, session, transport=None):
         self.session = session
         self.storage = storage
+        self.transport = transport or default_transport
+        self.motion_index = get_parsed_motion_index(storage)
+        self.roll_call = get_roll_call_matrix(storage)
+        self.ballot_pipeline = get_ballot_pipeline(storage)
 
     def parse_votes(self, request_session, htree):
-        tables = htree.cssselect("table.dataTableExHov")
-        if len(tables) > 0:
-            lines = tables[0].cssselect("tbody>tr")
-            for line in lines:
+        """
+        Walk all pages of the votes table of the session, then download the
+        ballot pages of new votes concurrently and save them in table order.
+        The table is paginated with JSF forms, so request_session has to be
+        the session which loaded htree.
+        """
+        rows = [
+            row
+            for row in self.iter_vote_rows(request_session, htree)
+            if not self.motion_index.is_parsed(gov_id=row["uid"])
+        ]
+        print(f"Session has {len(rows)} new votes")
+        if not rows:
+            return
+
+        responses = get_many_with_retry(
+            [f"{BASE_URL}{row['ballots_url']}" for row in rows],
+            transport=self.transport,
+        )
+        try:
+            for row, response in zip(rows, responses):
+                parsed_ballots = self.parse_ballots_content(response.content)
+                self.save_vote(row, parsed_ballots)
+        finally:
+            # motions of buffered ballots are already saved
+            self.ballot_pipeline.flush()
+            self.roll_call.save()
+
+    def iter_vote_rows(self, request_session, htree):
+        """
+        yield rows of all pages of the votes table, following the pager
+        """
+        while True:
+            tables = htree.cssselect("table.dataTableExHov")
+            if not tables:
+                return
+            for line in tables[0].cssselect("tbody>tr"):
                 columns = line.cssselect("td")
                 # if there's not date for vote, skip it
                 if (
@@ -27,78 +69,20 @@ class VotesParser(object):
                 ):
                     continue
                 date = columns[0].cssselect("a")[0].text
-                print(date)
                 time = columns[1].cssselect("a")[0].text
                 if columns[3].cssselect("a"):
                     epa = columns[3].cssselect("a")[0].text
                 else:
                     epa = ""
-                url_text = columns[4].cssselect("a")[0].text
                 ballots_url = columns[4].cssselect("a")[0].get("href")
                 uid = parse.parse_qs(parse.urlsplit(ballots_url).query)["uid"][0]
-
-                if self.session.vote_storage.check_if_motion_is_parsed({"gov_id": uid}):
-                    print("this vote is already parsed")
-                    continue
-
-                parsed_ballots = self.parse_ballots(ballots_url)
-
-                try:
-                    start_time = datetime.strptime(f"{date} {time}", "%d. %m. %Y %X")
-                except Exception as e:
-                    # TODO send sentry error
-                    print("parse date error", e)
-                    continue
-
-                motion_meta = parsed_ballots["meta"]
-                if motion_meta["title"]:
-                    title = f'{motion_meta["title"]} - {motion_meta["doc_name"]}'
-                else:
-                    title = motion_meta["doc_name"]
-
-                # dont parse motion without title
-                if not title:
-                    continue
-
-                legislation_id = None
-                if epa:
-                    legislation = self.storage.legislation_storage.update_or_add_law(
-                        {
-                            "epa": epa,
-                            "mandate": self.storage.mandate_id,
-                        }
-                    )
-                    legislation_id = legislation.id
-
-                motion = {
-                    "title": title,
-                    "text": title,
-                    "datetime": start_time.isoformat(),
-                    "session": self.session.id,
-                    "gov_id": uid,
+                yield {
+                    "date": date,
+                    "time": time,
+                    "epa": epa,
+                    "ballots_url": ballots_url,
+                    "uid": uid,
                 }
-                if legislation_id:
-                    motion["law"] = legislation_id
-
-                motion_obj = self.session.vote_storage.get_or_add_object(motion)
-
-                vote_id = int(motion_obj.vote.id)
-
-                self.save_ballots(parsed_ballots["ballots"], vote_id)
-
-                # TODO add links to votes...
-                # for link in data['links']:
-                #     # save links
-                #     link_data = {
-                #         'motion': motion_id,
-                #         #'agenda_item': self.agenda_item_id,
-                #         'url': link['url'],
-                #         'name': link['title'],
-                #         'tags': [link['tag']]
-                #     }
-                #     if 'law' in motion.keys():
-                #         link_data.update({'law': motion['law']})
-                #     self.storage.parladata_api.links.set(link_data)
 
             # follow pagination
             try:
@@ -108,33 +92,95 @@ class VotesParser(object):
                 return
             current_page = paging_meta[1]
             last_page = paging_meta[3]
-            if int(current_page) < int(last_page):
-                post_url = htree.cssselect("form")[0].get("action")
-                form_id = htree.cssselect("form")[0].get("id")
-                view_state = htree.cssselect('input[name="javax.faces.ViewState"]')[
-                    0
-                ].get("value")
-                url_encode = htree.cssselect('input[name="javax.faces.encodedURL"]')[
-                    0
-                ].get("value")
-
-                url = f"{BASE_URL}{post_url}"
-                payload = {
-                    "vax.faces.encodedURL": url_encode,
-                    f"{form_id}_SUBMIT": 1,
-                    f"{form_id}:tableEx1:goto1__pagerGoText": 2,
-                    "javax.faces.ViewState": view_state,
-                    f"{form_id}:tableEx1:deluxe1__pagerNext.x": 0,
-                    f"{form_id}:tableEx1:deluxe1__pagerNext.y": 0,
-                }
+            if int(current_page) >= int(last_page):
+                return
 
-                response = request_session.post(url, data=payload)
-                session_htree = html.fromstring(response.content)
-                self.parse_votes(request_session, session_htree)
+            post_url = htree.cssselect("form")[0].get("action")
+            form_id = htree.cssselect("form")[0].get("id")
+            view_state = htree.cssselect('input[name="javax.faces.ViewState"]')[0].get(
+                "value"
+            )
+            url_encode = htree.cssselect('input[name="javax.faces.encodedURL"]')[0].get(
+                "value"
+            )
 
-    def parse_ballots(self, url):
+            url = f"{BASE_URL}{post_url}"
+            payload = {
+                "vax.faces.encodedURL": url_encode,
+                f"{form_id}_SUBMIT": 1,
+                f"{form_id}:tableEx1:goto1__pagerGoText": 2,
+                "javax.faces.ViewState": view_state,
+                f"{form_id}:tableEx1:deluxe1__pagerNext.x": 0,
+                f"{form_id}:tableEx1:deluxe1__pagerNext.y": 0,
+            }
+
+            response = request_session.post(url, data=payload)
+            htree = html.fromstring(response.content)
+
+    def save_vote(self, row, parsed_ballots):
+        print(row["date"])
+        try:
+            start_time = datetime.strptime(
+                f"{row['date']} {row['time']}", "%d. %m. %Y %X"
+            )
+        except Exception as e:
+            # TODO send sentry error
+            print("parse date error", e)
+            return
+
+        motion_meta = parsed_ballots["meta"]
+        if motion_meta["title"]:
+            title = f'{motion_meta["title"]} - {motion_meta["doc_name"]}'
+        else:
+            title = motion_meta["doc_name"]
+
+        # dont parse motion without title
+        if not title:
+            return
+
+        legislation_id = None
+        if row["epa"]:
+            legislation = self.storage.legislation_storage.update_or_add_law(
+                {
+                    "epa": row["epa"],
+                    "mandate": self.storage.mandate_id,
+                }
+            )
+            legislation_id = legislation.id
+
+        motion = {
+            "title": title,
+            "text": title,
+            "datetime": start_time.isoformat(),
+            "session": self.session.id,
+            "gov_id": row["uid"],
+        }
+        if legislation_id:
+            motion["law"] = legislation_id
+
+        motion_obj = self.session.vote_storage.get_or_add_object(motion)
+        self.motion_index.add(motion["datetime"], row["uid"])
+
+        vote_id = int(motion_obj.vote.id)
+
+        self.save_ballots(parsed_ballots["ballots"], vote_id)
+
+        # TODO add links to votes...
+        # for link in data['links']:
+        #     # save links
+        #     link_data = {
+        #         'motion': motion_id,
+        #         #'agenda_item': self.agenda_item_id,
+        #         'url': link['url'],
+        #         'name': link['title'],
+        #         'tags': [link['tag']]
+        #     }
+        #     if 'law' in motion.keys():
+        #         link_data.update({'law': motion['law']})
+        #     self.storage.parladata_api.links.set(link_data)
+
+    def parse_ballots_content(self, ballots_content):
         output = {"ballots": [], "meta": {}}
-        ballots_content = requests.get(url=f"{BASE_URL}{url}").content
         htree = html.fromstring(ballots_content)
         body = htree.cssselect(".stControlBody")[0]
         tables = body.cssselect("table")
@@ -181,11 +227,12 @@ class VotesParser(object):
         return output
 
     def save_ballots(self, ballots, vote_id):
+        people = get_people_resolver(self.storage).resolve_many(
+            [ballot["voter"] for ballot in ballots]
+        )
         ballots_for_save = []
         for ballot in ballots:
-            person = self.storage.people_storage.get_or_add_object(
-                {"name": ballot["voter"]}
-            )
+            person = people[ballot["voter"]]
             person_option = ""
             kvorum = ballot["kvorum"]
             option = ballot["option"]
@@ -202,4 +249,5 @@ class VotesParser(object):
             ballots_for_save.append(
                 {"personvoter": person.id, "option": person_option, "vote": vote_id}
             )
-        self.session.vote_storage.set_ballots(ballots_for_save)
+        self.ballot_pipeline.add(ballots_for_save)
+        self.roll_call.add_ballots(vote_id, ballots_for_save)
@@ -1,12 +1,26 @@
-import requests
+from datetime import datetime, timedelta
+
 import sentry_sdk
-import xmltodict
+from lxml import etree
+
+from parlaparser.utils.ballots import get_ballot_pipeline
+from parlaparser.utils.feed_cache import FeedCache
+from parlaparser.utils.motions import get_parsed_motion_index
+from parlaparser.utils.people import get_people_resolver
+from parlaparser.utils.rollcall import get_roll_call_matrix
+from parlaparser.utils.state import StateStore
+from parlaparser.utils.transport import default_transport
+from parlaparser.utils.xml_stream import iter_records
 
 SESSION_TYPE = {
     "redna": "regular",
     "izredna": "irregular",
 }
 
+# votes published late can be older than the newest vote of the last run,
+# votes this much older are parsed again, the motion index skips saved ones
+HIGH_WATER_OVERLAP = timedelta(days=1)
+
 ROMAN_NUMERALS_MAP = {
     "9": "IX",
     "8": "VIII",
@@ -17,9 +31,18 @@ ROMAN_NUMERALS_MAP = {
 
 
 class VotesParser(object):
-    def __init__(self, storage, debug=False):
+    def __init__(self, storage, debug=False, transport=None):
         self.storage = storage
         self.debug = debug
+        self.transport = transport or default_transport
+        self.feed_cache = FeedCache(transport=self.transport)
+        self.state = StateStore("votes")
+        self.motion_index = get_parsed_motion_index(storage)
+        self.ballot_pipeline = get_ballot_pipeline(storage)
+        self.roll_call = get_roll_call_matrix(storage)
+
+    def get_high_water_key(self, file_name):
+        return f"{self.storage.MANDATE_GOV_ID}:{file_name}:last_timestamp"
 
     def parse(self, find_unid=None):
         votes_url_groups = [
@@ -35,106 +58,142 @@ class VotesParser(object):
             },
         ]
         for url_group in votes_url_groups:
-            response = requests.get(url_group["url"])
-            with open(f'/tmp/{url_group["file_name"]}', "wb") as f:
-                f.write(response.content)
-            with open(f'/tmp/{url_group["file_name"]}', "rb") as data_file:
-                data = xmltodict.parse(data_file, dict_constructor=dict)
-
-            votes_list = data["GLASOVANJA_SEZNAM"]["GLASOVANJE"]
-
-            for i, vote_xml in enumerate(votes_list):
-                timestamp = vote_xml["GLASOVANJE_DATUM_CAS"].split(".")[0]
-                vote_vrsta = vote_xml["VRSTA"]
-                vote_vrsta_dokumenta = vote_xml["VRSTA_DOKUMENTA"]
-                naslov_akta = vote_xml["NASLOV_AKTA"]
-                vote_zveza = vote_xml["ZVEZA"]
-                xml_mandate = vote_xml["MANDAT"]
-                vote_unid = vote_xml["UNID"]
-                seja = vote_xml["SEJA"]
-                if find_unid and vote_unid != find_unid:
-                    continue
-                if url_group["type"] == "DZ":
-                    session_name_org = seja["ID"].strip()
-                    session_name = session_name_org.strip("0")
-                    session_name_striped = session_name
-                    session_name = f"{session_name.lower()} seja"
-                    organization = (
-                        self.storage.organization_storage.get_organization_by_id(
-                            int(self.storage.main_org_id)
-                        )
-                    )
-                    session_gov_id = f"{self.storage.MANDATE_GOV_ID} Državni zbor - {session_name_striped}"
-                else:
-                    if not "DELOVNO_TELO" in seja.keys():
-                        continue
-                    session_full_name = seja["ID"].strip()
-                    session_gov_id_short = " ".join(session_full_name.split(" ")[1:])
-                    session_name = (
-                        f'{session_gov_id_short.lower().strip("0").strip()} seja'
-                    )
-                    org_gov_id_short = session_full_name.split(" ")[0]
-                    # dt_splited = seja["DELOVNO_TELO"].split("-")
-                    # org_gov_id_short = dt_splited[0].strip()
-                    # org_name = "-".join(dt_splited[1:]).strip()
-                    org_gov_id = f"DT{org_gov_id_short.strip().zfill(3)}"
-                    organization = (
-                        self.storage.organization_storage.get_organization_by_gov_id(
-                            org_gov_id
-                        )
-                    )
-                    if not organization:
-                        print(f" Organizationnot found: {org_gov_id}")
-                        print(vote_xml)
-
-                    org_gov_id_short = org_gov_id_short.lstrip("0")
-
-                    session_gov_id = f"{self.storage.MANDATE_GOV_ID} {org_gov_id_short} - {organization.name.strip()} - {session_gov_id_short}"
-
-                session_data = {
-                    "name": session_name,
-                    "gov_id": session_gov_id,
-                    "organization": organization.id,
-                    "timestamp": timestamp,
-                    "classification": SESSION_TYPE.get(seja["VRSTA"], "unknown"),
-                    "organizations": [organization.id],
-                }
-                if self.debug:
-                    print(session_data)
-                session = self.storage.session_storage.get_or_add_object(session_data)
-
-                if xml_mandate and xml_mandate.isdigit():
-                    xml_mandate = ROMAN_NUMERALS_MAP.get(xml_mandate)
-
-                epa = vote_xml.get("EPA")
-                if epa:
-                    epa = f"{epa}-{xml_mandate}"
-                uid = None
-
-                if session.vote_storage.check_if_motion_is_parsed(
-                    {"datetime": timestamp}
-                ):
-                    print("this vote is already parsed")
-                    continue
-
-                if naslov_akta:
-                    title = f"{naslov_akta} - {vote_zveza}"
-                elif vote_vrsta:
-                    title = vote_vrsta
-                elif vote_zveza:
-                    title = vote_zveza
-                else:
-                    print(vote_xml)
-                    sentry_sdk.capture_message(
-                        f"Vote without title vote_xml: {vote_xml} session_name: {session_name} timestamp: {timestamp}"
-                    )
-                    continue
-                    raise Exception("No title")
-
-                tocka = vote_xml["TOCKA"]
-                vote_id = self.save_data(session, title, timestamp, timestamp, epa=epa)
-                ballots = vote_xml["SEZNAM"]["VALUE"]
-                self.save_ballots(session, vote_id, ballots)
+            feed = self.feed_cache.fetch(url_group["url"], url_group["file_name"])
+            if not (feed.changed or find_unid):
+                print(f"Skip unchanged feed {url_group['file_name']}")
+                continue
+
+            # votes older than the newest vote of the last run are already
+            # parsed, they are dropped before any storage call
+            high_water_key = self.get_high_water_key(url_group["file_name"])
+            high_water = None if find_unid else self.state.get(high_water_key)
+            newest_timestamp = high_water
+            since = None
+            if high_water:
+                since = (
+                    datetime.fromisoformat(high_water) - HIGH_WATER_OVERLAP
+                ).isoformat()
+
+            try:
+                for vote_xml in self.iter_votes(feed.path, find_unid, since):
+                    self.parse_vote(vote_xml, url_group["type"])
+                    timestamp = vote_xml["GLASOVANJE_DATUM_CAS"].split(".")[0]
+                    if not newest_timestamp or timestamp > newest_timestamp:
+                        newest_timestamp = timestamp
+            except etree.XMLSyntaxError as e:
+                sentry_sdk.capture_exception(e)
+                continue
+            finally:
+                # motions of buffered ballots are already saved
+                self.ballot_pipeline.flush()
+                self.roll_call.save()
+
+            if not find_unid:
+                if newest_timestamp:
+                    self.state.set(high_water_key, newest_timestamp)
+                self.feed_cache.mark_processed(feed)
+
+    def iter_votes(self, path, find_unid=None, since=None):
+        """
+        stream votes of the mandate which aren't older than since
+        """
+        for _, vote_xml in iter_records(path, ("GLASOVANJE",)):
+            xml_mandate = vote_xml["MANDAT"]
+            if xml_mandate and xml_mandate.isdigit():
+                xml_mandate = ROMAN_NUMERALS_MAP.get(xml_mandate)
+            if xml_mandate and xml_mandate != self.storage.MANDATE_GOV_ID:
+                continue
+            if find_unid and vote_xml["UNID"] != find_unid:
+                continue
+            timestamp = vote_xml["GLASOVANJE_DATUM_CAS"].split(".")[0]
+            if since and timestamp < since:
+                continue
+            yield vote_xml
+
+    def parse_vote(self, vote_xml, vote_type):
+        timestamp = vote_xml["GLASOVANJE_DATUM_CAS"].split(".")[0]
+        vote_vrsta = vote_xml["VRSTA"]
+        vote_vrsta_dokumenta = vote_xml["VRSTA_DOKUMENTA"]
+        naslov_akta = vote_xml["NASLOV_AKTA"]
+        vote_zveza = vote_xml["ZVEZA"]
+        xml_mandate = vote_xml["MANDAT"]
+        seja = vote_xml["SEJA"]
+
+        if self.motion_index.is_parsed(datetime=timestamp):
+            print("this vote is already parsed")
+            return
+
+        if vote_type == "DZ":
+            session_name_org = seja["ID"].strip()
+            session_name = session_name_org.strip("0")
+            session_name_striped = session_name
+            session_name = f"{session_name.lower()} seja"
+            organization = self.storage.organization_storage.get_organization_by_id(
+                int(self.storage.main_org_id)
+            )
+            session_gov_id = (
+                f"{self.storage.MANDATE_GOV_ID} Državni zbor - {session_name_striped}"
+            )
+        else:
+            if not "DELOVNO_TELO" in seja.keys():
+                return
+            session_full_name = seja["ID"].strip()
+            session_gov_id_short = " ".join(session_full_name.split(" ")[1:])
+            session_name = f'{session_gov_id_short.lower().strip("0").strip()} seja'
+            org_gov_id_short = session_full_name.split(" ")[0]
+            # dt_splited = seja["DELOVNO_TELO"].split("-")
+            # org_gov_id_short = dt_splited[0].strip()
+            # org_name = "-".join(dt_splited[1:]).strip()
+            org_gov_id = f"DT{org_gov_id_short.strip().zfill(3)}"
+            organization = self.storage.organization_storage.get_organization_by_gov_id(
+                org_gov_id
+            )
+            if not organization:
+                print(f" Organizationnot found: {org_gov_id}")
+                print(vote_xml)
+
+            org_gov_id_short = org_gov_id_short.lstrip("0")
+
+            session_gov_id = f"{self.storage.MANDATE_GOV_ID} {org_gov_id_short} - {organization.name.strip()} - {session_gov_id_short}"
+
+        session_data = {
+            "name": session_name,
+            "gov_id": session_gov_id,
+            "organization": organization.id,
+            "timestamp": timestamp,
+            "classification": SESSION_TYPE.get(seja["VRSTA"], "unknown"),
+            "organizations": [organization.id],
+        }
+        if self.debug:
+            print(session_data)
+        session = self.storage.session_storage.get_or_add_object(session_data)
+
+        if xml_mandate and xml_mandate.isdigit():
+            xml_mandate = ROMAN_NUMERALS_MAP.get(xml_mandate)
+
+        epa = vote_xml.get("EPA")
+        if epa:
+            epa = f"{epa}-{xml_mandate}"
+        uid = None
+
+        if naslov_akta:
+            title = f"{naslov_akta} - {vote_zveza}"
+        elif vote_vrsta:
+            title = vote_vrsta
+        elif vote_zveza:
+            title = vote_zveza
+        else:
+            print(vote_xml)
+            sentry_sdk.capture_message(
+                f"Vote without title vote_xml: {vote_xml} session_name: {session_name} timestamp: {timestamp}"
+            )
+            return
+            raise Exception("No title")
+
+        tocka = vote_xml["TOCKA"]
+        vote_id = self.save_data(session, title, timestamp, timestamp, epa=epa)
+        ballots = vote_xml["SEZNAM"]["VALUE"]
+        self.save_ballots(session, vote_id, ballots)
 
     def save_data(self, session, title, start_time, uid, epa=""):
         legislation_id = None
@@ -159,19 +218,27 @@ class VotesParser(object):
         if self.debug:
             print(motion)
         motion_obj = session.vote_storage.get_or_add_object(motion)
+        self.motion_index.add(start_time, uid)
 
         vote_id = int(motion_obj.vote.id)
         return vote_id
 
     def save_ballots(self, session, vote_id, ballots):
-        ballots_for_save = []
+        ballots_data = []
         for ballot_str in ballots:
             data = ballot_str.split("|")
             if len(data) == 3:
                 name, kvorum, option = data
             else:
                 name, pg, kvorum, option = data
-            person = self.storage.people_storage.get_or_add_object({"name": name})
+            ballots_data.append((name, kvorum, option))
+        people = get_people_resolver(self.storage).resolve_many(
+            [name for name, kvorum, option in ballots_data]
+        )
+
+        ballots_for_save = []
+        for name, kvorum, option in ballots_data:
+            person = people[name]
             person_option = ""
             if kvorum == "_":
                 person_option = "absent"
@@ -186,4 +253,5 @@ class VotesParser(object):
             ballots_for_save.append(
                 {"personvoter": person.id, "option": person_option, "vote": vote_id}
             )
-        session.vote_storage.set_ballots(ballots_for_save)
+        self.ballot_pipeline.add(ballots_for_save)
+        self.roll_call.add_ballots(vote_id, ballots_for_save)
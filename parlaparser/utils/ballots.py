@@ -0,0 +1,111 @@
+import time
+
+from tenacity import Retrying, stop_after_attempt, wait_exponential
+
+from parlaparser.utils.rollcall import get_roll_call_matrix
+from parlaparser.utils.state import StateStore
+from settings import BALLOT_BATCH_SIZE
+
+
+class BallotPipeline(object):
+    """
+    Buffers ballots of many votes and saves them in bulk requests of at most
+    batch_size ballots. Ballots of one vote are never split between requests,
+    so a failed request is retried after deleting ballots of its votes, which
+    the api might have saved before failing. Call flush when the votes are
+    done.
+
+    Motions and votes are saved before their ballots, so the buffer is also
+    written to PARSER_STATE_DIR. Ballots left there by a run which was stopped
+    before flushing are saved again when the next run adds or flushes ballots.
+    """
+
+    def __init__(self, storage, batch_size=BALLOT_BATCH_SIZE):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.state = StateStore("ballots")
+        self.ballots = []
+        self.saved_ballots = 0
+        self.is_recovered = False
+
+    def recover(self):
+        """
+        save ballots buffered by a stopped run
+        """
+        self.is_recovered = True
+        ballots = self.state.get("buffered", [])
+        if not ballots:
+            return
+        print(f"Save {len(ballots)} ballots buffered by a stopped run")
+        # part of them may be saved already
+        self.delete_ballots(ballots)
+        self.save_batch(ballots)
+        roll_call = get_roll_call_matrix(self.storage)
+        ballots_by_vote = {}
+        for ballot in ballots:
+            ballots_by_vote.setdefault(ballot["vote"], []).append(ballot)
+        for vote_id, vote_ballots in ballots_by_vote.items():
+            roll_call.add_ballots(vote_id, vote_ballots)
+        roll_call.save()
+        self.state.set("buffered", [])
+
+    def add(self, ballots):
+        """
+        add all ballots of one vote
+        """
+        if not self.is_recovered:
+            self.recover()
+        if self.ballots and len(self.ballots) + len(ballots) > self.batch_size:
+            self.flush()
+        self.ballots.extend(ballots)
+        self.state.set("buffered", self.ballots)
+        if len(self.ballots) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.is_recovered:
+            self.recover()
+        if self.ballots:
+            self.save_batch(self.ballots)
+            self.ballots = []
+            self.state.set("buffered", self.ballots)
+
+    def post_batch(self, batch):
+        for attempt in Retrying(
+            stop=stop_after_attempt(3),
+            wait=wait_exponential(multiplier=2, min=2, max=30),
+            reraise=True,
+        ):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    self.delete_ballots(batch)
+                self.storage.parladata_api.ballots.set(batch)
+
+    def delete_ballots(self, batch):
+        vote_ids = {ballot["vote"] for ballot in batch}
+        print(f"Delete ballots of {len(vote_ids)} votes before saving them again")
+        for vote_id in vote_ids:
+            self.storage.parladata_api.votes.delete_vote_ballots(vote_id)
+
+    def save_batch(self, batch):
+        start = time.perf_counter()
+        self.post_batch(batch)
+        duration = time.perf_counter() - start
+        self.saved_ballots += len(batch)
+        print(
+            f"Saved {len(batch)} ballots in {duration:.2f}s "
+            f"({len(batch) / max(duration, 0.001):.0f} ballots/s), "
+            f"{self.saved_ballots} in total"
+        )
+
+
+def get_ballot_pipeline(storage):
+    """
+    return pipeline shared by all vote parsers which use the same storage,
+    they share the buffer in PARSER_STATE_DIR
+    """
+    pipeline = getattr(storage, "ballot_pipeline", None)
+    if pipeline is None:
+        pipeline = BallotPipeline(storage)
+        storage.ballot_pipeline = pipeline
+    return pipeline
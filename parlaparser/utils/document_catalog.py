@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+
+from settings import DOCUMENT_CATALOG_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    source TEXT NOT NULL,
+    unid TEXT NOT NULL,
+    title TEXT,
+    urls TEXT,
+    sub_docs TEXT,
+    magnetogram TEXT,
+    attachments TEXT,
+    PRIMARY KEY (source, unid)
+);
+CREATE TABLE IF NOT EXISTS feeds (
+    source TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (source, file_name)
+);
+"""
+
+UPSERT_DOCUMENT = """
+INSERT INTO documents (source, unid, title, urls, sub_docs, magnetogram)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, unid) DO UPDATE SET
+    title = excluded.title,
+    urls = excluded.urls,
+    sub_docs = excluded.sub_docs,
+    magnetogram = excluded.magnetogram,
+    attachments = NULL
+WHERE title IS NOT excluded.title
+    OR urls IS NOT excluded.urls
+    OR sub_docs IS NOT excluded.sub_docs
+    OR magnetogram IS NOT excluded.magnetogram
+"""
+
+
+def dumps(value):
+    if value is None:
+        return None
+    return json.dumps(value)
+
+
+def loads(value):
+    if value is None:
+        return None
+    return json.loads(value)
+
+
+class DocumentCatalog(object):
+    """
+    SQLite catalog of DOKUMENT records of the opendata feeds, shared by all
+    parsers and kept between runs. Documents are namespaced by source
+    (sessions, questions, legislation) because every feed builds titles from
+    different fields.
+
+    Documents of a feed are loaded once per feed content, the flattened list
+    of (url, title) attachments of documents with sub-documents is computed
+    when documents change, not on every lookup.
+    """
+
+    def __init__(self, path=DOCUMENT_CATALOG_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def is_loaded(self, source, feed):
+        """
+        True if documents of the current content of the feed are in the catalog
+        """
+        row = self.connection.execute(
+            "SELECT sha256 FROM feeds WHERE source = ? AND file_name = ?",
+            (source, os.path.basename(feed.path)),
+        ).fetchone()
+        return bool(row) and row[0] == feed.sha256
+
+    def mark_loaded(self, source, feed):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO feeds (source, file_name, sha256) VALUES (?, ?, ?)",
+                (source, os.path.basename(feed.path), feed.sha256),
+            )
+
+    def add_documents(self, source, documents):
+        """
+        Insert or update documents, a dict unid -> dict with title and urls,
+        sub-docs or magnetogram. Attachments of changed documents and of all
+        documents with sub-documents are computed again.
+        """
+        with self.connection:
+            changes = self.connection.total_changes
+            self.connection.executemany(
+                UPSERT_DOCUMENT,
+                (
+                    (
+                        source,
+                        unid,
+                        document.get("title"),
+                        dumps(document.get("urls")),
+                        dumps(document.get("sub-docs")),
+                        document.get("magnetogram"),
+                    )
+                    for unid, document in documents.items()
+                ),
+            )
+            changed = self.connection.total_changes - changes
+            if not changed:
+                return
+            self.connection.execute(
+                "UPDATE documents SET attachments = NULL WHERE source = ? AND sub_docs IS NOT NULL",
+                (source,),
+            )
+            self.update_attachments(source)
+        print(f"{changed} documents of {source} changed")
+
+    def update_attachments(self, source):
+        unids = [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT unid FROM documents WHERE source = ? AND attachments IS NULL",
+                (source,),
+            )
+        ]
+        for unid in unids:
+            self.connection.execute(
+                "UPDATE documents SET attachments = ? WHERE source = ? AND unid = ?",
+                (dumps(self.flatten(source, unid, set())), source, unid),
+            )
+
+    def flatten(self, source, unid, visited):
+        """
+        (url, title) of the document or of all its sub-documents
+        """
+        if unid in visited:
+            return []
+        visited.add(unid)
+        document = self.get_document(source, unid)
+        if not document:
+            return []
+        if "urls" in document:
+            return [(url, document["title"]) for url in document["urls"]]
+        attachments = []
+        for sub_unid in document["sub-docs"]:
+            attachments.extend(self.flatten(source, sub_unid, visited))
+        return attachments
+
+    def get_row(self, source, unid, columns):
+        return self.connection.execute(
+            f"SELECT {columns} FROM documents WHERE source = ? AND unid = ?",
+            (source, unid),
+        ).fetchone()
+
+    def get_document(self, source, unid):
+        """
+        return dict with title and urls or sub-docs, None for unknown
+        documents and documents which are only a magnetogram
+        """
+        row = self.get_row(source, unid, "title, urls, sub_docs")
+        if not row or (row[1] is None and row[2] is None):
+            return None
+        document = {"title": row[0]}
+        if row[1] is not None:
+            document["urls"] = loads(row[1])
+        else:
+            document["sub-docs"] = loads(row[2])
+        return document
+
+    def get_documents(self, source, unids):
+        """
+        return dict unid -> document for known unids
+        """
+        documents = {}
+        for unid in unids:
+            document = self.get_document(source, unid)
+            if document:
+                documents[unid] = document
+        return documents
+
+    def get_magnetogram(self, source, unid):
+        row = self.get_row(source, unid, "magnetogram")
+        return row[0] if row else None
+
+    def get_attachments(self, source, unid):
+        """
+        return flattened list of (url, title) of the document
+        """
+        row = self.get_row(source, unid, "attachments")
+        if not row or row[0] is None:
+            return []
+        return [tuple(attachment) for attachment in loads(row[0])]
+
+
+def get_document_catalog(storage):
+    """
+    return catalog shared by all parsers which use the same storage
+    """
+    catalog = getattr(storage, "document_catalog", None)
+    if catalog is None:
+        catalog = DocumentCatalog()
+        storage.document_catalog = catalog
+    return catalog
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+
+from parlaparser.utils.methods import get_with_retry
+from settings import FEED_CACHE_DIR
+
+
+class Feed(object):
+    def __init__(self, url, path, sha256, changed):
+        self.url = url
+        self.path = path
+        self.sha256 = sha256
+        self.changed = changed
+
+    def __repr__(self):
+        return f"<Feed {self.path} changed={self.changed}>"
+
+
+class FeedCache(object):
+    """
+    Keeps the last download of every opendata feed on disk together with its
+    ETag, Last-Modified header and content hash. Feeds are requested
+    conditionally, so an unchanged feed costs a single 304 response.
+
+    A feed counts as changed until mark_processed is called for its current
+    content, so a run which crashes halfway parses the feed again next time.
+    """
+
+    def __init__(self, cache_dir=FEED_CACHE_DIR, transport=None):
+        self.cache_dir = cache_dir
+        self.transport = transport
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_path(self, file_name):
+        return os.path.join(self.cache_dir, file_name)
+
+    def get_meta_path(self, file_name):
+        return os.path.join(self.cache_dir, f"{file_name}.json")
+
+    def load_meta(self, file_name):
+        try:
+            with open(self.get_meta_path(file_name), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_meta(self, file_name, meta):
+        meta_path = self.get_meta_path(file_name)
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def fetch(self, url, file_name):
+        path = self.get_path(file_name)
+        meta = self.load_meta(file_name)
+        if not os.path.exists(path):
+            meta = {}
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = get_with_retry(url, transport=self.transport, headers=headers)
+        if response.status_code == 304:
+            print(f"Feed {file_name} is not modified")
+        else:
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(response.content)
+            os.replace(f"{path}.tmp", path)
+            meta.update(
+                {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "sha256": hashlib.sha256(response.content).hexdigest(),
+                }
+            )
+            self.save_meta(file_name, meta)
+
+        changed = meta["sha256"] != meta.get("processed_sha256")
+        return Feed(url, path, meta["sha256"], changed)
+
+    def mark_processed(self, feed):
+        file_name = os.path.basename(feed.path)
+        meta = self.load_meta(file_name)
+        meta["processed_sha256"] = feed.sha256
+        self.save_meta(file_name, meta)
@@ -0,0 +1,62 @@
+import re
+
+
+class LineClassifier(object):
+    """
+    Precompiled transcript patterns of a SpeechParser. Every check starts with
+    a cheap substring test which every match of the pattern has to pass, so
+    most lines are classified without running a regex at all.
+    """
+
+    def __init__(self, parser):
+        self.find_trak = re.compile(parser.FIND_TRAK)
+        self.skip_session_pause = re.compile(parser.SKIP_SESSION_PAUSE)
+        self.start_of_content = re.compile(
+            parser.REGEX_IS_START_OF_CONTENT, re.IGNORECASE
+        )
+        self.start_wierd_wb_session = re.compile(
+            parser.REGEX_START_WIERD_WB_SESSION, re.IGNORECASE
+        )
+        self.date_time = re.compile(parser.DATE_TIME_REGEX)
+        self.session_pause = re.compile(parser.FIND_SESSION_PAUSE)
+        self.end_of_session = re.compile(parser.FIND_END_OF_SESSION)
+        self.find_name = re.compile(parser.FIND_NAME)
+
+    def is_trak(self, bold):
+        # FIND_TRAK ends with the word TRAK
+        return "TRAK" in bold and self.find_trak.search(bold) is not None
+
+    def is_skipped_pause(self, text):
+        # SKIP_SESSION_PAUSE starts with "(Seja je bila prekinjena"
+        return "(Seja" in text and self.skip_session_pause.search(text) is not None
+
+    def has_date_time(self, text):
+        # DATE_TIME_REGEX ends with a time like 09:00:00
+        return ":" in text and self.date_time.search(text) is not None
+
+    def is_start_of_content(self, text):
+        if text.startswith("Besedilo je objavljeno"):
+            return True
+        lower_text = text.lower()
+        if "eja " in lower_text and self.start_of_content.search(text):
+            return True
+        if "seje se je" in lower_text and self.start_wierd_wb_session.search(text):
+            return True
+        return self.has_date_time(text)
+
+    def is_session_note(self, text):
+        """
+        line is a note about a pause or the end of the session or a timestamp
+        """
+        if "(" in text:
+            if self.session_pause.search(text) or self.end_of_session.search(text):
+                return True
+        elif text.startswith("Seja ") and self.end_of_session.search(text):
+            return True
+        return self.has_date_time(text)
+
+    def match_name(self, name_candidate):
+        # FIND_NAME requires a colon after the name
+        if ":" not in name_candidate:
+            return None
+        return self.find_name.match(name_candidate)
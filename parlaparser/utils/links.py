@@ -0,0 +1,100 @@
+from settings import LINK_BATCH_SIZE
+
+# fields of a link which point to the object the link belongs to
+PARENT_FIELDS = [
+    "session",
+    "question",
+    "legislation",
+    "legislation_consideration",
+    "motion",
+    "agenda_item",
+]
+
+
+def get_link_key(link):
+    for field in PARENT_FIELDS:
+        parent = link.get(field)
+        if parent:
+            if isinstance(parent, dict):
+                parent = parent["id"]
+            return field, int(parent), link["url"]
+    return None, None, link["url"]
+
+
+class LinkSync(object):
+    """
+    Run scoped index of links as (parent field, parent id, url) keys. Existing
+    links of a parent are loaded once, when its first link is added, add skips
+    links which exist and buffers the missing ones, which are created in bulk
+    requests of at most batch_size links. Call flush when the run is done.
+    """
+
+    def __init__(self, storage, batch_size=LINK_BATCH_SIZE):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.keys = set()
+        self.loaded_parents = set()
+        self.links = []
+        self.bulk_create = True
+
+    def load_parent(self, field, parent):
+        """
+        add keys of existing links of the parent, all links if it has none
+        """
+        filters = {field: parent} if field else {}
+        for link in self.storage.parladata_api.links.get_all(**filters):
+            self.keys.add(get_link_key(link))
+        self.loaded_parents.add((field, parent))
+
+    def add(self, link_data):
+        key = get_link_key(link_data)
+        field, parent, url = key
+        if (field, parent) not in self.loaded_parents:
+            self.load_parent(field, parent)
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        self.links.append(link_data)
+        if len(self.links) >= self.batch_size:
+            self.flush()
+
+    def get_missing_links(self, links):
+        """
+        return links which a failed bulk request didn't create
+        """
+        for field, parent in {get_link_key(link)[:2] for link in links}:
+            filters = {field: parent} if field else {}
+            existing = {
+                get_link_key(link)
+                for link in self.storage.parladata_api.links.get_all(**filters)
+            }
+            links = [link for link in links if get_link_key(link) not in existing]
+        return links
+
+    def flush(self):
+        if not self.links:
+            return
+        links, self.links = self.links, []
+        print(f"Add {len(links)} new links")
+        if self.bulk_create:
+            try:
+                self.storage.parladata_api.links.set(links)
+                return
+            except Exception as e:
+                # the api wraps request errors in tenacity's RetryError
+                print(f"Bulk create of links failed, add them one by one: {e}")
+            self.bulk_create = False
+            links = self.get_missing_links(links)
+        for link_data in links:
+            self.storage.parladata_api.links.set(link_data)
+
+
+def get_link_sync(storage):
+    """
+    return link sync shared by all parsers which use the same storage
+    """
+    link_sync = getattr(storage, "link_sync", None)
+    if link_sync is None:
+        link_sync = LinkSync(storage)
+        storage.link_sync = link_sync
+    return link_sync
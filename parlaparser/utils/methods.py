@@ -1,18 +1,64 @@
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
+
 from tenacity import retry, stop_after_attempt, wait_chain, wait_fixed
 
+from parlaparser.utils.transport import default_transport
+from settings import HTTP_MAX_PER_HOST, HTTP_MAX_WORKERS, TIME_ZONE
+
+host_semaphores = {}
+host_semaphores_lock = threading.Lock()
 
-@retry(
+
+# backoff of 10, 30 and 60 seconds between four attempts
+retry_get = retry(
     stop=stop_after_attempt(4),
     wait=wait_chain(wait_fixed(10), wait_fixed(30), wait_fixed(60)),
     reraise=True,
 )
-def get_with_retry(url, **kwargs):
-    response = requests.get(url, **kwargs)
+
+
+def get(url, transport=None, **kwargs):
+    response = (transport or default_transport).get(url, **kwargs)
     response.raise_for_status()
     return response
 
 
+@retry_get
+def get_with_retry(url, transport=None, **kwargs):
+    return get(url, transport=transport, **kwargs)
+
+
+def get_host_semaphore(url):
+    host = urlsplit(url).netloc
+    with host_semaphores_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.BoundedSemaphore(HTTP_MAX_PER_HOST)
+        return host_semaphores[host]
+
+
+@retry_get
+def get_with_host_limit(url, **kwargs):
+    # the host slot is taken per attempt and is free while backing off
+    with get_host_semaphore(url):
+        return get(url, **kwargs)
+
+
+def get_many_with_retry(urls, max_workers=HTTP_MAX_WORKERS, **kwargs):
+    """
+    Download urls concurrently, at most HTTP_MAX_PER_HOST at once per host.
+    Responses are returned in the same order as urls.
+    """
+    urls = list(urls)
+    if len(urls) < 2:
+        return [get_with_retry(url, **kwargs) for url in urls]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        return list(executor.map(lambda url: get_with_host_limit(url, **kwargs), urls))
+
+
 def get_values(data, key="UNID"):
     if isinstance(data, dict):
         children = data.get(key)
@@ -28,3 +74,17 @@ def get_values(data, key="UNID"):
         return [data]
     else:
         return []
+
+
+def normalize_time(value):
+    """
+    return naive local datetime of an isoformat string or datetime, the api
+    returns aware timestamps while the parser builds naive local ones
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo:
+        value = value.astimezone(ZoneInfo(TIME_ZONE)).replace(tzinfo=None)
+    return value
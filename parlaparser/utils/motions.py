@@ -0,0 +1,50 @@
+from parlaparser.utils.methods import normalize_time
+
+
+class ParsedMotionIndex(object):
+    """
+    Datetimes and gov ids of all motions of the mandate. They are loaded with
+    one paginated request on first use, so checking if a vote is already
+    parsed doesn't need a storage round trip per session or vote. Datetimes
+    are compared as naive local datetimes, the api returns aware ones.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.datetimes = set()
+        self.gov_ids = set()
+        self.is_loaded = False
+
+    def load(self):
+        print("Loading parsed motions")
+        motions = self.storage.parladata_api.motions.get_all(
+            session__mandate=self.storage.mandate_id
+        )
+        for motion in motions:
+            self.add(motion["datetime"], motion["gov_id"])
+        self.is_loaded = True
+        print(f"Loaded {len(self.datetimes)} parsed motions")
+
+    def add(self, datetime=None, gov_id=None):
+        if datetime:
+            self.datetimes.add(normalize_time(datetime))
+        if gov_id:
+            self.gov_ids.add(gov_id)
+
+    def is_parsed(self, datetime=None, gov_id=None):
+        if not self.is_loaded:
+            self.load()
+        return (
+            datetime is not None and normalize_time(datetime) in self.datetimes
+        ) or (gov_id is not None and gov_id in self.gov_ids)
+
+
+def get_parsed_motion_index(storage):
+    """
+    return index shared by all parsers which use the same storage
+    """
+    index = getattr(storage, "parsed_motion_index", None)
+    if index is None:
+        index = ParsedMotionIndex(storage)
+        storage.parsed_motion_index = index
+    return index
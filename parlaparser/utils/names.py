@@ -0,0 +1,187 @@
+import re
+from functools import lru_cache
+
+# misspelled titles in front of speaker names, removed in this order
+REMOVE_FROM_NAME = [
+    "PREDSEDNIK ",
+    "PREDSENDIK ",
+    "PODPREDSEDNIK ",
+    "PODPREDSENIK ",
+    "PODPREDSEDNICA ",
+    "PREDSEDIK ",
+    "POD ",
+    "PREDSEDNICA ",
+    "PREDSEDUJOČI ",
+    "PRESEDNICA ",
+    "POPDREDSEDNIK ",
+    "PREDSENICA ",
+    "PRESEDNIK ",
+    "PRESDEDNIK ",
+    "REDSEDNIK ",
+    "PREDSEDDNICA ",
+    "PEDSEDNIK ",
+    "PREDEDNIK ",
+    "PREDSEDNK ",
+    "REDSEDNICA ",
+    "PREDSDNIK ",
+    "DSEDNIK ",
+    "PREDEDNICA ",
+    "PREDSENIK ",
+    "PREDSENDICA ",
+    "PRDSEDNIK ",
+    "PREDSEDNCA ",
+    "PRDSEDNICA ",
+    "PREDSEDNNICA ",
+    "PREDSEDNI ",
+    "Nadaljevanje",
+    "nadaljevanje",
+    "PREDSEDINK ",
+    "PODPREDSEDINCA ",
+    "PODPRDSEDNICA ",
+    "PODPREDSEDICA ",
+    "PODPREDSEDNI ",
+    "PPREDSEDNIK ",
+    "PREDSEDNIKCA ",
+    "PODPPREDSEDNIK ",
+    "PREDSEDNIKA ",
+    "PREEDSEDNIK ",
+    "PODPREDSDNICA ",
+    "POPREDSEDNICA ",
+    "PREDSEDSEDNIK ",
+    "PODPREDSENDIK ",
+    "PREDSEDNIKI ",
+    "PODPRDSEDNIK ",
+    "PODPPREDSEDNICA ",
+    "PPODPREDSEDNI ",
+    "PODPEDSEDNIK ",
+    "PODREDSEDNIK ",
+    "PODPREDSEDNCA ",
+    "PODPREDSENICA ",
+    "PODPREDSEDNK ",
+    "PODPREDSDNIK ",
+    "PODREDSEDNICA ",
+    "PODPRESEDNICA ",
+    "PREDSEDINCA ",
+    "PREDSEDNCIA ",
+    "PREDSDEDNIK ",
+    "PREDSEDDNIK ",
+    "PREDESEDNIK ",
+    "PREDSDENIK ",
+    "PREDESENIK ",
+    "PREDSEDICA ",
+    "DPREDSEDNIK ",
+    "EDSEDNIK ",
+    "PODPREDEDNIK ",
+]
+
+# words which can't be part of a name, the line is part of an agenda item
+FORBIDDEN_NAME_WORDS = [
+    "obravnav",
+    "postopka",
+    "zakona",
+    "prekinjena",
+    "vprašanja",
+    "davku",
+    "prehajamo",
+    "dnevnega",
+    "poročilo",
+    "problematika",
+    "evropske",
+    "evropsko",
+    "administrativne",
+    "predstavitev",
+    "industrijski",
+    "nalezljivih",
+    "predlogu",
+    "skupno",
+    "obvestilo",
+    "omenjene",
+    "gospodarstvu",
+    "neonacizem",
+    "negospodarnega",
+    "nadzor",
+    "sodišča",
+    "prisilni",
+    "slovenije",
+    "madžarkskega",
+    "predlog",
+    "dogovor",
+    "proračuna",
+    "onesnaženost",
+    "problematiko",
+    "aktualne",
+    "zakonsko",
+    "predkazenskih",
+    "postopkov",
+    "zoper",
+    "seznanitev",
+]
+
+
+class PrefixTrie(object):
+    """
+    Trie of prefixes which finds all prefixes of a string in one walk over it.
+    """
+
+    def __init__(self, prefixes):
+        self.root = {}
+        for index, prefix in enumerate(prefixes):
+            node = self.root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(index)
+
+    def find(self, text):
+        """
+        return indexes of all prefixes text starts with
+        """
+        indexes = []
+        node = self.root
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            indexes.extend(node.get(None, []))
+        return indexes
+
+
+remove_from_name_trie = PrefixTrie(REMOVE_FROM_NAME)
+forbidden_name_words_regex = re.compile(
+    "|".join(re.escape(word) for word in FORBIDDEN_NAME_WORDS)
+)
+
+
+@lru_cache(maxsize=4096)
+def fix_name(full_name):
+    """
+    Remove titles from the start of the name. Titles are checked in the order
+    of REMOVE_FROM_NAME against the already cleaned name, same as checking
+    them one by one with startswith.
+    """
+    full_name = full_name.strip()
+    next_index = 0
+    while True:
+        indexes = [
+            index
+            for index in remove_from_name_trie.find(full_name)
+            if index >= next_index
+        ]
+        if not indexes:
+            return full_name
+        index = min(indexes)
+        full_name = full_name.replace(REMOVE_FROM_NAME[index], "").strip()
+        next_index = index + 1
+
+
+@lru_cache(maxsize=4096)
+def is_valid_name(full_name):
+    """
+    Checker for valid names
+    Name is unvalid if;
+        * if combiend form more 5 words
+        * contains forbiden words
+    """
+    full_name = full_name.strip()
+    if len(full_name.split(" ")) > 5:
+        return False
+    return forbidden_name_words_regex.search(full_name.lower()) is None
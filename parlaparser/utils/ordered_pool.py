@@ -0,0 +1,157 @@
+import multiprocessing
+import os
+import queue
+import traceback
+from collections import deque
+
+from settings import WORKER_MAX_RSS_MB, WORKER_MAX_TASKS
+
+
+def get_rss():
+    """
+    resident set size of the current process in bytes
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def worker_loop(tasks, results, max_tasks, max_rss):
+    """
+    Run tasks until the queue is closed. The worker exits after max_tasks
+    tasks or as soon as its memory grows over max_rss, the pool starts a fresh
+    one instead.
+    """
+    done = 0
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, func, args = task
+        try:
+            output, error = func(args), None
+        except Exception:
+            output, error = None, traceback.format_exc()
+        done += 1
+        recycle = done >= max_tasks or get_rss() > max_rss
+        results.put((task_id, output, error, recycle, os.getpid()))
+        if recycle:
+            return
+
+
+class OrderedPool(object):
+    """
+    Process pool which hands results back in the order the tasks were
+    submitted. Callbacks run in the calling process, so they can write to the
+    storage. At most max_pending tasks are in flight, the caller blocks on the
+    oldest one before submitting more.
+
+    Workers are recycled after max_tasks_per_child tasks or when their RSS
+    exceeds max_rss_mb, so memory of a long run is bounded by the largest
+    single task.
+    """
+
+    def __init__(
+        self,
+        processes,
+        max_pending=None,
+        max_tasks_per_child=WORKER_MAX_TASKS,
+        max_rss_mb=WORKER_MAX_RSS_MB,
+    ):
+        self.max_pending = max_pending or processes * 2
+        self.max_tasks_per_child = max_tasks_per_child
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.workers = {}
+        self.pending = deque()
+        self.finished = {}
+        self.next_task_id = 0
+        for _ in range(processes):
+            self.start_worker()
+
+    def start_worker(self):
+        worker = multiprocessing.Process(
+            target=worker_loop,
+            args=(self.tasks, self.results, self.max_tasks_per_child, self.max_rss),
+            daemon=True,
+        )
+        worker.start()
+        self.workers[worker.pid] = worker
+
+    def replace_worker(self, pid):
+        worker = self.workers.pop(pid)
+        worker.join()
+        self.start_worker()
+
+    def check_workers(self):
+        for pid, worker in list(self.workers.items()):
+            if not worker.is_alive() and worker.exitcode != 0:
+                # killed from outside, the task it was running is lost
+                raise RuntimeError(
+                    f"Worker {pid} exited with code {worker.exitcode}, "
+                    "try lowering PARSER_WORKER_MAX_RSS_MB"
+                )
+
+    def receive(self, timeout=None):
+        """
+        store one finished task, return False if nothing finished in time
+        """
+        try:
+            if timeout is None:
+                message = self.results.get_nowait()
+            else:
+                message = self.results.get(timeout=timeout)
+        except queue.Empty:
+            self.check_workers()
+            return False
+        task_id, output, error, recycle, pid = message
+        self.finished[task_id] = (output, error)
+        if recycle:
+            self.replace_worker(pid)
+        return True
+
+    def submit(self, func, args, callback):
+        self.tasks.put((self.next_task_id, func, args))
+        self.pending.append((self.next_task_id, callback))
+        self.next_task_id += 1
+        self.collect(wait=len(self.pending) > self.max_pending)
+
+    def collect(self, wait=False):
+        """
+        run callbacks of finished tasks in submit order, wait for the oldest
+        task if wait is set
+        """
+        while self.receive():
+            pass
+        while self.pending:
+            task_id, callback = self.pending[0]
+            while wait and task_id not in self.finished:
+                self.receive(timeout=1)
+            if task_id not in self.finished:
+                return
+            self.pending.popleft()
+            output, error = self.finished.pop(task_id)
+            if error:
+                raise RuntimeError(f"Task {task_id} failed in worker:\n{error}")
+            callback(output)
+            wait = False
+
+    def drain(self):
+        while self.pending:
+            self.collect(wait=True)
+
+    def close(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers.values():
+            worker.join()
+        self.workers = {}
+
+    def terminate(self):
+        for worker in self.workers.values():
+            worker.terminate()
+            worker.join()
+        self.workers = {}
@@ -0,0 +1,142 @@
+from parladata_base_api.storages.people_storage import Person
+
+
+class PeopleResolver(object):
+    """
+    Run scoped name -> person resolver on top of PeopleStorage.
+
+    PeopleStorage.get_or_add_object scans all parser names for every call.
+    The resolver indexes parser names once, resolves every distinct name only
+    once per run and creates all unknown names of a batch with one request.
+    If the api doesn't accept a list, people are created one by one for the
+    rest of the run.
+    """
+
+    def __init__(self, people_storage):
+        self.people_storage = people_storage
+        self.people_by_parser_name = {}
+        self.indexed_people = None
+        self.resolved = {}
+        self.bulk_create = True
+
+    def update_index(self):
+        """
+        (re)build the parser name index when people were added to the storage
+        by someone else
+        """
+        people = self.people_storage.people
+        if not people:
+            self.people_storage.load_data()
+        if self.indexed_people == len(people):
+            return
+        self.people_by_parser_name = {}
+        for parser_names, person in people.items():
+            for parser_name in parser_names.split("|"):
+                # first match wins, same as Storage.get_object_by_parsername
+                self.people_by_parser_name.setdefault(parser_name, person)
+        self.indexed_people = len(people)
+
+    def get_person_data(self, name):
+        prefix, name = self.people_storage.get_prefix(name)
+        person_data = {"name": name.strip().title(), "parser_names": name.strip()}
+        if prefix:
+            person_data["honorific_prefix"] = prefix
+        return name, person_data
+
+    def find(self, name):
+        """
+        return Person with the parser name or None, nobody is created
+        """
+        self.update_index()
+        prefix, name = self.people_storage.get_prefix(name)
+        return self.people_by_parser_name.get(name.lower())
+
+    def resolve(self, name):
+        return self.resolve_many([name])[name]
+
+    def resolve_many(self, names):
+        """
+        return dict name -> Person for all names, unknown people are created
+        """
+        output = {}
+        new_people = {}
+        for name in names:
+            if name in output or name in new_people:
+                continue
+            if name in self.resolved:
+                output[name] = self.resolved[name]
+                continue
+            self.update_index()
+            parser_name, person_data = self.get_person_data(name)
+            person = self.people_by_parser_name.get(parser_name.lower())
+            if person:
+                output[name] = self.resolved[name] = person
+            else:
+                new_people[name] = person_data
+
+        if new_people:
+            for name, person in self.add_people(new_people).items():
+                output[name] = self.resolved[name] = person
+        return output
+
+    def add_people(self, new_people):
+        """
+        create people in one request, fall back to one request per person if
+        the api doesn't accept a list or the request fails, later batches are
+        then added one by one as well
+        """
+        print(f"Add {len(new_people)} new people")
+        output = {}
+        if self.bulk_create:
+            people_data = list(new_people.values())
+            try:
+                response_data = self.people_storage.parladata_api.people.set(
+                    people_data
+                )
+            except Exception as e:
+                # the api wraps request errors in tenacity's RetryError
+                print(f"Bulk create of people failed, add them one by one: {e}")
+                response_data = None
+
+            if isinstance(response_data, list) and len(response_data) == len(
+                people_data
+            ):
+                for name, person_data in zip(new_people.keys(), response_data):
+                    output[name] = self.people_storage.store_object(
+                        person_data, is_new=True
+                    )
+                self.update_index()
+                return output
+            self.bulk_create = False
+            self.load_created_people(new_people.values())
+
+        for name in new_people.keys():
+            output[name] = self.people_storage.get_or_add_object({"name": name})
+        self.update_index()
+        return output
+
+    def load_created_people(self, people_data):
+        """
+        store people of the batch which a failed bulk request created anyway,
+        so they aren't created again one by one
+        """
+        people = self.people_storage.people
+        keys = {Person.get_key_from_dict(person_data) for person_data in people_data}
+        for person_data in people_data:
+            for person in self.people_storage.parladata_api.people.get_all(
+                name=person_data["name"]
+            ):
+                key = Person.get_key_from_dict(person)
+                if key in keys and key not in people:
+                    self.people_storage.store_object(person, is_new=True)
+
+
+def get_people_resolver(storage):
+    """
+    return resolver shared by all parsers which use the same storage
+    """
+    resolver = getattr(storage, "people_resolver", None)
+    if resolver is None:
+        resolver = PeopleResolver(storage.people_storage)
+        storage.people_resolver = resolver
+    return resolver
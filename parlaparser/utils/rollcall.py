@@ -0,0 +1,146 @@
+import json
+import os
+
+import numpy as np
+
+from settings import ROLL_CALL_DIR
+
+NO_BALLOT = 0
+OPTION_CODES = {
+    "for": 1,
+    "against": 2,
+    "abstain": 3,
+    "absent": 4,
+}
+PRESENT_CODES = [OPTION_CODES["for"], OPTION_CODES["against"], OPTION_CODES["abstain"]]
+
+
+class RollCallMatrix(object):
+    """
+    People x votes matrix of ballot option codes of one mandate, kept in a
+    memory mapped .npy file next to a JSON index of row (person id) and column
+    (vote id) positions. Ballots are written as the vote parsers save them,
+    results and attendance are computed with vectorized operations.
+
+    The file grows by doubling its capacity, call save to flush the matrix
+    and write the index.
+    """
+
+    def __init__(self, mandate_id, directory=ROLL_CALL_DIR):
+        self.directory = os.path.join(directory, str(mandate_id))
+        self.matrix_path = os.path.join(self.directory, "matrix.npy")
+        self.index_path = os.path.join(self.directory, "index.json")
+        os.makedirs(self.directory, exist_ok=True)
+
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self.rows = {int(key): value for key, value in index["people"].items()}
+            self.columns = {int(key): value for key, value in index["votes"].items()}
+            self.matrix = np.load(self.matrix_path, mmap_mode="r+")
+        except (OSError, ValueError, KeyError):
+            self.rows = {}
+            self.columns = {}
+            self.matrix = self.create_matrix(self.matrix_path, (256, 1024))
+
+    def create_matrix(self, path, shape):
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.int8, shape=shape)
+
+    def ensure_capacity(self, people, votes):
+        capacity_people, capacity_votes = self.matrix.shape
+        if people <= capacity_people and votes <= capacity_votes:
+            return
+        while capacity_people < people:
+            capacity_people *= 2
+        while capacity_votes < votes:
+            capacity_votes *= 2
+
+        tmp_path = f"{self.matrix_path}.tmp"
+        matrix = self.create_matrix(tmp_path, (capacity_people, capacity_votes))
+        old_people, old_votes = self.matrix.shape
+        matrix[:old_people, :old_votes] = self.matrix
+        matrix.flush()
+        del matrix
+        del self.matrix
+        os.replace(tmp_path, self.matrix_path)
+        self.matrix = np.load(self.matrix_path, mmap_mode="r+")
+
+    def get_row(self, person_id):
+        if person_id not in self.rows:
+            self.rows[person_id] = len(self.rows)
+        return self.rows[person_id]
+
+    def get_column(self, vote_id):
+        if vote_id not in self.columns:
+            self.columns[vote_id] = len(self.columns)
+        return self.columns[vote_id]
+
+    def add_ballots(self, vote_id, ballots):
+        """
+        store ballots of one vote, ballots are dicts with personvoter and option
+        """
+        column = self.get_column(vote_id)
+        rows = np.array(
+            [self.get_row(ballot["personvoter"]) for ballot in ballots], dtype=np.intp
+        )
+        codes = np.array(
+            [OPTION_CODES.get(ballot["option"], NO_BALLOT) for ballot in ballots],
+            dtype=np.int8,
+        )
+        self.ensure_capacity(len(self.rows), len(self.columns))
+        self.matrix[:, column] = NO_BALLOT
+        self.matrix[rows, column] = codes
+
+    def save(self):
+        self.matrix.flush()
+        index = {
+            "people": {str(key): value for key, value in self.rows.items()},
+            "votes": {str(key): value for key, value in self.columns.items()},
+        }
+        with open(f"{self.index_path}.tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+
+    def get_matrix(self):
+        """
+        used part of the matrix, rows in order of self.rows and columns in
+        order of self.columns
+        """
+        return self.matrix[: len(self.rows), : len(self.columns)]
+
+    def get_vote_results(self):
+        """
+        return dict vote id -> dict option -> number of ballots
+        """
+        matrix = self.get_matrix()
+        counts = {
+            option: np.count_nonzero(matrix == code, axis=0)
+            for option, code in OPTION_CODES.items()
+        }
+        return {
+            vote_id: {option: int(counts[option][column]) for option in OPTION_CODES}
+            for vote_id, column in self.columns.items()
+        }
+
+    def get_attendance(self):
+        """
+        return dict person id -> share of votes the person was present at
+        """
+        matrix = self.get_matrix()
+        present = np.isin(matrix, PRESENT_CODES).sum(axis=1)
+        with_ballot = np.count_nonzero(matrix != NO_BALLOT, axis=1)
+        attendance = present / np.maximum(with_ballot, 1)
+        return {
+            person_id: float(attendance[row]) for person_id, row in self.rows.items()
+        }
+
+
+def get_roll_call_matrix(storage):
+    """
+    return matrix shared by all vote parsers which use the same storage
+    """
+    matrix = getattr(storage, "roll_call_matrix", None)
+    if matrix is None:
+        matrix = RollCallMatrix(storage.mandate_id)
+        storage.roll_call_matrix = matrix
+    return matrix
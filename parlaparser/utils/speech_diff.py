@@ -0,0 +1,78 @@
+import hashlib
+from difflib import SequenceMatcher
+
+from parlaparser.utils.methods import normalize_time
+
+# fields of a speech which are patched when they change
+SPEECH_FIELDS = ["speaker", "content", "order", "start_time"]
+
+
+def get_speaker_id(speech):
+    speaker = speech["speaker"]
+    if isinstance(speaker, dict):
+        return speaker["id"]
+    return speaker
+
+
+def get_speech_key(speech):
+    content_hash = hashlib.sha256(speech["content"].encode("utf-8")).hexdigest()
+    return get_speaker_id(speech), content_hash
+
+
+def get_changed_fields(stored_speech, speech):
+    changed = {}
+    for field in SPEECH_FIELDS:
+        if field == "speaker":
+            stored_value = get_speaker_id(stored_speech)
+            value = get_speaker_id(speech)
+        elif field == "start_time":
+            stored_value = normalize_time(stored_speech.get(field))
+            value = normalize_time(speech[field])
+        else:
+            stored_value = stored_speech.get(field)
+            value = speech[field]
+        if stored_value != value:
+            changed[field] = speech[field]
+    return changed
+
+
+def diff_speeches(stored_speeches, speeches):
+    """
+    Align speeches of the final transcript with the stored speeches of the
+    session by speaker and content and return the edits which turn the stored
+    ones into the final ones:
+
+    inserts -- speeches to add
+    updates -- (speech id, changed fields) of speeches which moved or changed
+    deletes -- ids of stored speeches which aren't in the transcript anymore
+    """
+    stored_speeches = sorted(stored_speeches, key=lambda speech: speech["order"])
+    matcher = SequenceMatcher(
+        None,
+        [get_speech_key(speech) for speech in stored_speeches],
+        [get_speech_key(speech) for speech in speeches],
+        autojunk=False,
+    )
+
+    inserts = []
+    updates = []
+    deletes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        old = stored_speeches[i1:i2]
+        new = speeches[j1:j2]
+        if tag == "delete":
+            deletes.extend(speech["id"] for speech in old)
+            continue
+        if tag == "insert":
+            inserts.extend(new)
+            continue
+
+        # equal speeches may have moved, replaced speeches are edited in place
+        for stored_speech, speech in zip(old, new):
+            changed = get_changed_fields(stored_speech, speech)
+            if changed:
+                updates.append((stored_speech["id"], changed))
+        deletes.extend(speech["id"] for speech in old[len(new) :])
+        inserts.extend(new[len(old) :])
+
+    return inserts, updates, deletes
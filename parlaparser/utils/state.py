@@ -0,0 +1,33 @@
+import json
+import os
+
+from settings import STATE_DIR
+
+
+class StateStore(object):
+    """
+    Small JSON key-value store in PARSER_STATE_DIR for values which have to
+    survive between runs, like the newest parsed timestamp of a feed.
+    """
+
+    def __init__(self, name, state_dir=STATE_DIR):
+        os.makedirs(state_dir, exist_ok=True)
+        self.path = os.path.join(state_dir, f"{name}.json")
+        try:
+            with open(self.path, "r") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value, save=True):
+        self.data[key] = value
+        if save:
+            self.save()
+
+    def save(self):
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(self.data, f)
+        os.replace(f"{self.path}.tmp", self.path)
@@ -0,0 +1,262 @@
+TEXT = 0
+ELEMENT = 1
+BREAK = 2
+# end of a bold element which was split by a <br>
+BOLD_END = 3
+# start or end tag of an unwrapped element, the line isn't empty because of it
+TAG = 4
+
+NO_BOLD = object()
+
+
+class TranscriptLine(object):
+    """
+    One <br> separated line of a transcript.
+
+    text -- text content of the whole line
+    lead -- text before the first element
+    bold -- text of the first <b> element (None if it starts with a child)
+    tail -- text right after the first element, None if there is none
+    is_empty -- line has neither text nor elements
+    """
+
+    __slots__ = ("text", "lead", "has_bold", "bold", "tail", "is_empty")
+
+    def __init__(self, text, lead, has_bold, bold, tail, is_empty=False):
+        self.text = text
+        self.lead = lead
+        self.has_bold = has_bold
+        self.bold = bold
+        self.tail = tail
+        self.is_empty = is_empty
+
+    def __repr__(self):
+        return f"<TranscriptLine {self.text!r}>"
+
+    def without_prefix(self, prefix):
+        if not self.lead.startswith(prefix):
+            return self
+        return TranscriptLine(
+            self.text[len(prefix) :],
+            self.lead[len(prefix) :],
+            self.has_bold,
+            self.bold,
+            self.tail,
+        )
+
+
+class Item(object):
+    __slots__ = ("kind", "tag", "text", "content", "has_children", "bold", "is_open")
+
+    def __init__(self, kind, text, tag=None, content=None, has_children=False):
+        self.kind = kind
+        self.tag = tag
+        self.text = text
+        self.content = text if content is None else content
+        self.has_children = has_children
+        self.bold = NO_BOLD
+        self.is_open = False
+
+
+def element_item(element):
+    item = Item(
+        ELEMENT,
+        element.text,
+        tag=element.tag,
+        content=element.text_content(),
+        has_children=len(element) > 0,
+    )
+    if element.tag == "b":
+        item.bold = element.text
+    else:
+        for bold in element.iter("b"):
+            if len(bold) or (bold.text or "").strip():
+                item.bold = bold.text
+                break
+    return item
+
+
+def flatten(element, with_text=True):
+    """
+    Yield the content of element as text, inline element and break items.
+    Inline elements which contain a <br> are unwrapped, so their parts end up
+    on separate lines.
+    """
+    if with_text and element.text:
+        yield Item(TEXT, element.text)
+    yield from flatten_children(element)
+
+
+def flatten_children(children):
+    """
+    flatten a list of sibling elements, nodes stay where they are in the tree
+    """
+    for child in children:
+        if not isinstance(child.tag, str):
+            # comments and processing instructions
+            pass
+        elif child.tag == "br":
+            yield Item(BREAK, None)
+        elif child.find(".//br") is not None:
+            if child.tag == "b":
+                yield from flatten_split_bold(child)
+            else:
+                yield Item(TAG, "")
+                if child.text:
+                    yield Item(TEXT, child.text)
+                yield from flatten_children(child)
+                yield Item(TAG, "")
+        else:
+            yield element_item(child)
+        if child.tail:
+            yield Item(TEXT, child.tail)
+
+
+def flatten_split_bold(element):
+    """
+    Only the part of a bold element before its first <br> is bold, the rest
+    of it ends up on the following lines as plain text.
+    """
+    children = list(element)
+    split_at = len(children)
+    for index, child in enumerate(children):
+        if child.tag == "br" or child.find(".//br") is not None:
+            split_at = index
+            break
+
+    content = [element.text or ""]
+    for child in children[:split_at]:
+        content.append(child.text_content())
+        content.append(child.tail or "")
+    item = Item(
+        ELEMENT,
+        element.text,
+        tag="b",
+        content="".join(content),
+        has_children=split_at > 0,
+    )
+    item.bold = element.text
+    item.is_open = True
+    yield item
+
+    yield from flatten_children(children[split_at:])
+    yield Item(BOLD_END, "")
+
+
+def is_bold(item):
+    return item.kind == ELEMENT and item.tag == "b"
+
+
+def merge_bold_items(items):
+    """
+    join bold elements separated only by whitespace into one bold element
+    and drop bold elements without text
+    """
+    merged = []
+    for item in items:
+        if is_bold(item) and merged:
+            previous = merged[-1]
+            spaces = ""
+            if previous.kind == TEXT and not previous.text.strip() and len(merged) > 1:
+                spaces = previous.text
+                previous = merged[-2]
+            if previous.kind == BOLD_END:
+                # the bold element continues the unclosed one and is plain text
+                if spaces:
+                    merged.pop()
+                merged.pop()
+                merged.append(Item(TEXT, spaces + item.content))
+                merged.append(previous)
+                continue
+            if is_bold(previous):
+                if spaces:
+                    merged.pop()
+                if not previous.has_children:
+                    text = (previous.text or "") + spaces + (item.text or "")
+                    previous.text = text or None
+                    previous.bold = previous.text
+                    previous.has_children = item.has_children
+                previous.content = previous.content + spaces + item.content
+                previous.is_open = item.is_open
+                continue
+        merged.append(item)
+
+    output = []
+    for item in merged:
+        if (
+            is_bold(item)
+            and not item.is_open
+            and not item.has_children
+            and not (item.text or "").strip()
+        ):
+            item = Item(TEXT, item.text or "")
+        output.append(item)
+    return output
+
+
+def strip_items(items):
+    while items and items[0].kind == TEXT:
+        items[0].text = items[0].text.lstrip()
+        if items[0].text:
+            break
+        del items[0]
+    while items and items[-1].kind == TEXT:
+        items[-1].text = items[-1].text.rstrip()
+        if items[-1].text:
+            break
+        del items[-1]
+    if items and items[-1].is_open and not items[-1].has_children:
+        # the line ends inside of the bold element
+        last = items[-1]
+        last.text = (last.text or "").rstrip() or None
+        last.content = last.content.rstrip()
+        last.bold = last.text
+    return items
+
+
+def build_line(items):
+    items = strip_items(merge_bold_items(items))
+
+    text = []
+    lead = []
+    tail = None
+    has_bold = False
+    bold = None
+    elements = 0
+    for item in items:
+        if item.kind in (BOLD_END, TAG):
+            continue
+        if item.kind == TEXT:
+            text.append(item.text)
+            if not elements:
+                lead.append(item.text)
+            elif elements == 1:
+                tail = (tail or "") + item.text
+            continue
+
+        text.append(item.content)
+        elements += 1
+        if not has_bold and item.bold is not NO_BOLD:
+            has_bold = True
+            bold = item.bold
+
+    return TranscriptLine(
+        "".join(text), "".join(lead), has_bold, bold, tail, is_empty=not items
+    )
+
+
+def iter_lines(element):
+    """
+    Walk the transcript element once and yield a TranscriptLine for every line
+    separated by <br>.
+    """
+    items = []
+    for item in flatten(element):
+        if item.kind == BREAK:
+            yield build_line(items)
+            items = []
+        else:
+            items.append(item)
+    if element.tail:
+        items.append(Item(TEXT, element.tail))
+    yield build_line(items)
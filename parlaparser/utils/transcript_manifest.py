@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+from lxml import etree
+
+from settings import TRANSCRIPT_MANIFEST_DIR
+
+
+def get_page_hash(htree):
+    """
+    hash of the transcript form, the rest of the portal page changes between
+    requests
+    """
+    forms = htree.cssselect("form")
+    element = forms[0] if forms else htree
+    return hashlib.sha256(etree.tostring(element, encoding="utf-8")).hexdigest()
+
+
+def get_speech_fingerprint(speech):
+    """
+    hash of the speaker and the content of a parsed speech
+    """
+    data = f"{speech['person']}\n{speech['content']}".encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_page_fingerprint(speech_fingerprints):
+    """
+    hash of the speeches of a page, equal for pages with equal speeches
+    """
+    return hashlib.sha256("|".join(speech_fingerprints).encode("utf-8")).hexdigest()
+
+
+class TranscriptManifest(object):
+    """
+    Per session record of parsed transcript pages. For every page it keeps the
+    url, the content hash, the fingerprint of its speeches and the order of
+    the last speech on the page, so a session in review can continue at the
+    first page which changed.
+    """
+
+    def __init__(self, session_id, manifest_dir=TRANSCRIPT_MANIFEST_DIR):
+        self.path = os.path.join(manifest_dir, f"{session_id}.json")
+        os.makedirs(manifest_dir, exist_ok=True)
+        try:
+            with open(self.path, "r") as f:
+                self.pages = json.load(f)["pages"]
+        except (OSError, ValueError, KeyError):
+            self.pages = []
+
+    def get_page(self, index):
+        if index >= len(self.pages):
+            return None
+        return self.pages[index]
+
+    def get_unchanged_page(self, index, url, sha256):
+        """
+        return stored page if the page at index has the same url and content
+        """
+        page = self.get_page(index)
+        if not page or page["url"] != url or page["sha256"] != sha256:
+            return None
+        return page
+
+    def set_page(self, index, url, sha256, last_order, fingerprint=None):
+        # pages after a changed page have to be parsed again
+        del self.pages[index:]
+        self.pages.append(
+            {
+                "url": url,
+                "sha256": sha256,
+                "last_order": last_order,
+                "fingerprint": fingerprint,
+            }
+        )
+        self.save()
+
+    def save(self):
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump({"pages": self.pages}, f)
+        os.replace(f"{self.path}.tmp", self.path)
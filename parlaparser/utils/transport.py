@@ -0,0 +1,31 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+from settings import HTTP_POOL_SIZE, HTTP_TIMEOUT
+
+
+class Transport(object):
+    """
+    HTTP client shared by all parsers. Connections are pooled per host and
+    kept alive between requests, responses are requested gzip encoded and
+    every request gets a default timeout.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+
+default_transport = Transport()
@@ -0,0 +1,55 @@
+from lxml import etree
+
+
+def element_to_dict(element):
+    """
+    Convert element to the structure xmltodict.parse(..., dict_constructor=dict)
+    builds for it, so streamed records can be used by the existing code.
+    """
+    data = {f"@{key}": value for key, value in element.attrib.items()}
+    text = [element.text] if element.text else []
+    for child in element:
+        if child.tail:
+            text.append(child.tail)
+        if not isinstance(child.tag, str):
+            # comments and processing instructions
+            continue
+        value = element_to_dict(child)
+        if child.tag in data:
+            if not isinstance(data[child.tag], list):
+                data[child.tag] = [data[child.tag]]
+            data[child.tag].append(value)
+        else:
+            data[child.tag] = value
+
+    text = "".join(text).strip() or None
+    if not data:
+        return text
+    if text:
+        data["#text"] = text
+    return data
+
+
+def iter_records(path, tags):
+    """
+    Stream (tag, record) pairs for every element with one of the tags, in
+    document order. Records are built with element_to_dict. Processed elements
+    and everything parsed before them are released, so memory stays flat
+    regardless of the document size. Elements nested inside another matched
+    element are only part of the outer record.
+    """
+    tags = set(tags)
+    context = etree.iterparse(path, events=("end",), tag=tags, huge_tree=True)
+    for _, element in context:
+        ancestors = list(element.iterancestors())
+        if any(ancestor.tag in tags for ancestor in ancestors):
+            continue
+
+        yield element.tag, element_to_dict(element)
+
+        element.clear(keep_tail=False)
+        for node in [element] + ancestors[:-1]:
+            parent = node.getparent()
+            while node.getprevious() is not None:
+                del parent[0]
+    del context
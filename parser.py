@@ -11,6 +11,7 @@ from parlaparser.parse_questions import QuestionParser
 from parlaparser.parse_sessions import SessionParser
 from parlaparser.parse_sifrant import MembershipsParser
 from parlaparser.parse_votes_xml import VotesParser
+from parlaparser.utils.transport import Transport
 from settings import (
     API_AUTH,
     API_URL,
@@ -34,6 +35,7 @@ storage = DataStorage(
     MANDATE, MANDATE_STARTIME, MAIN_ORG_ID, API_URL, API_AUTH[0], API_AUTH[1]
 )
 storage.MANDATE_GOV_ID = MANDATE_GOV_ID
+transport = Transport()
 Motion.keys = ["datetime"]
 Vote.keys = ["timestamp"]
 LegislationConsideration.keys = [
@@ -44,7 +46,7 @@ LegislationConsideration.keys = [
 ]
 
 # try:
-#     parse_sifrant = MembershipsParser(storage)
+#     parse_sifrant = MembershipsParser(storage, transport=transport)
 #     parse_sifrant.parse()
 # except Exception as e:
 #     print(e)
@@ -52,7 +54,7 @@ LegislationConsideration.keys = [
 
 # session votes / speeches
 try:
-    session_parser = SessionParser(storage)
+    session_parser = SessionParser(storage, transport=transport)
     session_parser.parse(parse_speeches=True, parse_votes=False)
 except Exception as e:
     print(e)
@@ -60,7 +62,7 @@ except Exception as e:
 
 
 try:
-    session_parser = VotesParser(storage)
+    session_parser = VotesParser(storage, transport=transport)
     session_parser.parse()
 except Exception as e:
     print(e)
@@ -72,7 +74,7 @@ except Exception as e:
 # Disable questions and legislation parser (because DZ doesn't published it yet for new mandate)
 # # # # questions
 # try:
-#     question_parser = QuestionParser(storage)
+#     question_parser = QuestionParser(storage, transport=transport)
 #     question_parser.parse()
 # except Exception as e:
 #     print(e)
@@ -85,5 +87,5 @@ except Exception as e:
 # )
 # storage.MANDATE_GOV_ID = MANDATE_GOV_ID
 # # legislation
-# legislation_parser = LegislationParser(storage)
+# legislation_parser = LegislationParser(storage, transport=transport)
 # legislation_parser.parse()
@@ -13,3 +13,22 @@ MAIN_ORG_ID = os.getenv("PARSER_MAIN_ORG_ID", 590)
 MANDATE = os.getenv("PARSER_MANDATE_ID", "4")
 MANDATE_GOV_ID = os.getenv("PARSER_MANDATE_GOV_ID", "X")
 BASE_URL = "https://www.dz-rs.si"
+TIME_ZONE = os.getenv("PARSER_TIME_ZONE", "Europe/Ljubljana")
+STATE_DIR = os.getenv("PARSER_STATE_DIR", "/tmp/parlaparser")
+FEED_CACHE_DIR = os.path.join(STATE_DIR, "feeds")
+HTTP_MAX_WORKERS = int(os.getenv("PARSER_HTTP_MAX_WORKERS", 8))
+HTTP_MAX_PER_HOST = int(os.getenv("PARSER_HTTP_MAX_PER_HOST", 4))
+HTTP_TIMEOUT = float(os.getenv("PARSER_HTTP_TIMEOUT", 60))
+HTTP_POOL_SIZE = int(os.getenv("PARSER_HTTP_POOL_SIZE", 16))
+TRANSCRIPT_MANIFEST_DIR = os.path.join(STATE_DIR, "transcripts")
+# share of stored speeches which may change before a synced session is saved again
+SPEECH_SYNC_MAX_CHANGES = float(os.getenv("PARSER_SPEECH_SYNC_MAX_CHANGES", 0.1))
+SPEECH_PARSER_PROCESSES = int(os.getenv("PARSER_SPEECH_PROCESSES", 1))
+LEGISLATION_PARSER_PROCESSES = int(os.getenv("PARSER_LEGISLATION_PROCESSES", 1))
+WORKER_MAX_TASKS = int(os.getenv("PARSER_WORKER_MAX_TASKS", 20))
+WORKER_MAX_RSS_MB = int(os.getenv("PARSER_WORKER_MAX_RSS_MB", 1024))
+BALLOT_BATCH_SIZE = int(os.getenv("PARSER_BALLOT_BATCH_SIZE", 1000))
+LINK_BATCH_SIZE = int(os.getenv("PARSER_LINK_BATCH_SIZE", 500))
+QUESTION_BATCH_SIZE = int(os.getenv("PARSER_QUESTION_BATCH_SIZE", 200))
+ROLL_CALL_DIR = os.path.join(STATE_DIR, "rollcall")
+DOCUMENT_CATALOG_PATH = os.path.join(STATE_DIR, "documents.sqlite3")
@@ -0,0 +1,57 @@
+from parlaparser.utils import ballots
+from parlaparser.utils.ballots import BallotPipeline
+from parlaparser.utils.state import StateStore
+
+
+class Api(object):
+    def __init__(self):
+        self.requests = []
+        self.ballots = self
+        self.votes = self
+
+    def set(self, batch):
+        self.requests.append(("set", [ballot["vote"] for ballot in batch]))
+
+    def delete_vote_ballots(self, vote_id):
+        self.requests.append(("delete", vote_id))
+
+
+class RollCall(object):
+    def __init__(self):
+        self.votes = []
+
+    def add_ballots(self, vote_id, ballots):
+        self.votes.append(vote_id)
+
+    def save(self):
+        pass
+
+
+class Storage(object):
+    def __init__(self):
+        self.parladata_api = Api()
+
+
+def get_ballots(vote_id, count=2):
+    return [{"personvoter": 1, "option": "for", "vote": vote_id}] * count
+
+
+def test_ballots_of_stopped_run_are_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr(ballots, "StateStore", lambda name: StateStore(name, tmp_path))
+    roll_call = RollCall()
+    monkeypatch.setattr(ballots, "get_roll_call_matrix", lambda storage: roll_call)
+
+    stopped = BallotPipeline(Storage(), batch_size=3)
+    stopped.add(get_ballots(1))
+    stopped.add(get_ballots(2))
+    # the run stops before flush
+    assert stopped.storage.parladata_api.requests == [("set", [1, 1])]
+
+    storage = Storage()
+    pipeline = BallotPipeline(storage, batch_size=3)
+    pipeline.flush()
+    assert storage.parladata_api.requests == [("delete", 2), ("set", [2, 2])]
+    assert roll_call.votes == [2]
+
+    pipeline.flush()
+    assert BallotPipeline(Storage()).state.get("buffered") == []
@@ -0,0 +1,51 @@
+from parlaparser.utils.links import LinkSync
+
+
+class LinksApi(object):
+    def __init__(self, links, fail_bulk=False):
+        self.links = links
+        self.fail_bulk = fail_bulk
+        self.filters = []
+
+    def get_all(self, **filters):
+        self.filters.append(filters)
+        return [
+            link
+            for link in self.links
+            if all(link.get(field) == value for field, value in filters.items())
+        ]
+
+    def set(self, data):
+        if isinstance(data, list):
+            # saves the first link and fails
+            self.links.append(data[0])
+            if self.fail_bulk:
+                raise Exception("timeout")
+            self.links.extend(data[1:])
+        else:
+            self.links.append(data)
+
+
+class Storage(object):
+    def __init__(self, links_api):
+        self.parladata_api = type("Api", (), {"links": links_api})()
+
+
+def test_existing_links_of_parent_are_skipped():
+    api = LinksApi([{"session": 1, "url": "a"}, {"session": 2, "url": "b"}])
+    link_sync = LinkSync(Storage(api))
+    link_sync.add({"session": 1, "url": "a"})
+    link_sync.add({"session": 1, "url": "c"})
+    link_sync.flush()
+    assert api.filters == [{"session": 1}]
+    assert [link["url"] for link in api.links] == ["a", "b", "c"]
+
+
+def test_failed_bulk_create_is_not_repeated():
+    api = LinksApi([], fail_bulk=True)
+    link_sync = LinkSync(Storage(api))
+    for url in ["a", "b", "c"]:
+        link_sync.add({"question": 5, "url": url})
+    link_sync.flush()
+    assert [link["url"] for link in api.links] == ["a", "b", "c"]
+    assert not link_sync.bulk_create
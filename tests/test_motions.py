@@ -0,0 +1,24 @@
+from parlaparser.utils.motions import ParsedMotionIndex
+
+
+class MotionsApi(object):
+    def get_all(self, **filters):
+        return [{"datetime": "2026-05-12T10:15:00+02:00", "gov_id": "abc"}]
+
+
+class Storage(object):
+    mandate_id = 4
+    parladata_api = type("Api", (), {"motions": MotionsApi()})()
+
+
+def test_naive_vote_time_matches_aware_motion_time():
+    index = ParsedMotionIndex(Storage())
+    assert index.is_parsed(datetime="2026-05-12T10:15:00")
+    assert not index.is_parsed(datetime="2026-05-12T08:15:00")
+    assert index.is_parsed(gov_id="abc")
+
+
+def test_added_motion_is_parsed():
+    index = ParsedMotionIndex(Storage())
+    index.add("2026-05-13T09:00:00", "def")
+    assert index.is_parsed(datetime="2026-05-13T07:00:00Z")
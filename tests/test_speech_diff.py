@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from parlaparser.utils.speech_diff import diff_speeches, get_changed_fields
+
+
+def get_speech(order, content, start_time="2026-05-12T10:00:00", speaker=1):
+    return {
+        "speaker": speaker,
+        "content": content,
+        "order": order,
+        "start_time": start_time,
+    }
+
+
+def test_aware_start_time_is_not_changed():
+    stored = dict(get_speech(1, "a", "2026-05-12T10:00:00+02:00"), id=1)
+    assert get_changed_fields(stored, get_speech(1, "a")) == {}
+    assert (
+        get_changed_fields(stored, get_speech(1, "a", datetime(2026, 5, 12, 10))) == {}
+    )
+
+
+def test_utc_start_time_is_not_changed():
+    stored = dict(get_speech(1, "a", "2026-05-12T08:00:00Z"), id=1)
+    assert get_changed_fields(stored, get_speech(1, "a")) == {}
+
+
+def test_inserted_speech_shifts_orders():
+    stored = [
+        dict(get_speech(1, "a", "2026-05-12T10:00:00+02:00", {"id": 1}), id=11),
+        dict(get_speech(2, "b", "2026-05-12T10:00:00+02:00", {"id": 1}), id=12),
+    ]
+    final = [get_speech(1, "new"), get_speech(2, "a"), get_speech(3, "b")]
+    inserts, updates, deletes = diff_speeches(stored, final)
+    assert inserts == [final[0]]
+    assert updates == [(11, {"order": 2}), (12, {"order": 3})]
+    assert deletes == []
@@ -0,0 +1,45 @@
+from lxml import html
+
+from parlaparser.utils.transcript_lines import iter_lines
+
+
+def get_lines(source):
+    return [
+        (line.text, line.has_bold, line.bold, line.tail, line.is_empty)
+        for line in iter_lines(html.fragment_fromstring(source))
+    ]
+
+
+def test_split_bold_with_nested_elements():
+    source = (
+        "<div><b>JANEZ NOVAK:<br><span>Hvala.<br><i>(Aplavz.)</i></span></b>"
+        " Konec.</div>"
+    )
+    assert get_lines(source) == [
+        ("JANEZ NOVAK:", True, "JANEZ NOVAK:", None, False),
+        ("Hvala.", False, None, None, False),
+        ("(Aplavz.) Konec.", False, None, " Konec.", False),
+    ]
+
+
+def test_split_bold_with_break_in_nested_element():
+    assert get_lines("<div><b>A<br><i><br><u>x</u></i></b></div>") == [
+        ("A", True, "A", None, False),
+        ("", False, None, None, False),
+        ("x", False, None, None, False),
+    ]
+
+
+def test_split_bold_is_not_merged_with_next_bold():
+    source = "<div><b>JANEZ NOVAK:<br>Hvala.</b>  <b>Marko Horvat:</b> Prosim.</div>"
+    assert get_lines(source) == [
+        ("JANEZ NOVAK:", True, "JANEZ NOVAK:", None, False),
+        ("Hvala.  Marko Horvat: Prosim.", False, None, None, False),
+    ]
+
+
+def test_split_bold_keeps_page_tree():
+    div = html.fragment_fromstring("<div><b>A<br><span>b<br><i>c</i></span></b></div>")
+    before = html.tostring(div)
+    list(iter_lines(div))
+    assert html.tostring(div) == before